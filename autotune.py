@@ -0,0 +1,139 @@
+######## Interpreter pool auto-tuning #########
+#
+# Description:
+# Sweeps the number of pooled interpreters and the number of CPU threads per
+# interpreter on the current machine, measures detection throughput for each
+# combination and records the fastest configuration. Frames are replayed
+# through the same Pipeline the detection scripts run with --interpreters,
+# which prepares frames on one thread and invokes the interpreters in
+# parallel, so the sweep only credits throughput the scripts can reach. The
+# recorded configuration turns the pipeline on in the scripts, even for a
+# single interpreter.
+# The optimum differs between Pi 4 units and x86 test boxes, so run this once
+# on every kind of device. detect.py and run_visa.py pick up the recorded
+# configuration with --tuning.
+#
+# Example:
+# python autotune.py --modeldir mobilenet --output mobilenet/autotune.json
+
+# Import packages
+import os
+import argparse
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from visa import BACKENDS, DetectorPool, Pipeline, VideoStream, save_tuning
+from visa.replay import load_frames, open_replay
+
+# Define and parse input arguments
+parser = argparse.ArgumentParser()
+parser.add_argument('--modeldir', help='Folder the .tflite file is located in',
+                    required=True)
+parser.add_argument('--graph', help='Name of the .tflite file, if different than detect.tflite',
+                    default='detect.tflite')
+parser.add_argument('--backend', help='Inference backend, auto picks it from the model file extension (.tflite, .xml, .onnx)',
+                    choices=('auto',) + BACKENDS, default='auto')
+parser.add_argument('--resolution', help='Resolution of the frames in WxH',
+                    default='1280x720')
+parser.add_argument('--replay', help='Video file, image directory or .npy dump to replay instead of synthetic frames',
+                    default=None)
+parser.add_argument('--queuesize', help='Capacity of each queue between pipeline stages',
+                    default=2)
+parser.add_argument('--frames', help='Number of frames to run for every configuration',
+                    default=100)
+parser.add_argument('--maxinterpreters', help='Largest number of pooled interpreters to try',
+                    default=4)
+parser.add_argument('--maxthreads', help='Largest number of threads per interpreter to try, defaults to the CPU count',
+                    default=None)
+parser.add_argument('--output', help='Where to record the best configuration, defaults to autotune.json in the model folder',
+                    default=None)
+
+args = parser.parse_args()
+
+resW, resH = args.resolution.split('x')
+imW, imH = int(resW), int(resH)
+num_frames = int(args.frames)
+queue_size = int(args.queuesize)
+max_interpreters = int(args.maxinterpreters)
+max_threads = int(args.maxthreads) if args.maxthreads else (os.cpu_count() or 1)
+
+PATH_TO_CKPT = os.path.join(os.getcwd(), args.modeldir, args.graph)
+PATH_TO_TUNING = args.output or os.path.join(os.getcwd(), args.modeldir, 'autotune.json')
+
+
+def measure(pool, replay, warmup_frame):
+    """Replay frames through a Pipeline on the pool until num_frames are rendered, return frames per second"""
+    # Warm up every interpreter so allocation and first-run costs are not measured
+    for detector in pool:
+        detector.detect(warmup_frame)
+
+    source = open_replay(replay, rate='fast', loop=True)
+    videostream = VideoStream(resolution=(imW, imH), framerate=30,
+                              pool_size=Pipeline.pool_size(queue_size, len(pool)), source=source).start()
+    rendered = [0]
+
+    def handle_result(frame, detections):
+        rendered[0] += 1
+        return rendered[0] < num_frames
+
+    start = time.perf_counter()
+    Pipeline(pool, videostream, handle_result, queue_size=queue_size).run()
+    elapsed = time.perf_counter() - start
+    videostream.stop()
+    return rendered[0] / elapsed
+
+
+if args.replay:
+    replay = args.replay
+    temporary = None
+else:
+    # Synthetic noise frames; the detection results do not matter, only the timing does
+    rng = np.random.RandomState(0)
+    frames = rng.randint(0, 256, (16, imH, imW, 3), dtype=np.uint8)
+    temporary = tempfile.NamedTemporaryFile(suffix='.npy', delete=False)
+    np.save(temporary, frames)
+    temporary.close()
+    replay = temporary.name
+warmup_frame = load_frames(replay, 1, imW, imH)[0]
+
+print('Tuning {} on {} ({} CPUs)'.format(PATH_TO_CKPT, platform.machine(), os.cpu_count()))
+print('{:>12} {:>8} {:>10}'.format('interpreters', 'threads', 'FPS'))
+
+sweep = []
+try:
+    for num_interpreters in range(1, max_interpreters + 1):
+        for num_threads in range(1, max_threads + 1):
+            # Far more busy threads than cores only adds contention
+            if num_interpreters * num_threads > 2 * max_threads:
+                continue
+            pool = DetectorPool(PATH_TO_CKPT, size=num_interpreters, num_threads=num_threads, backend=args.backend)
+            fps = measure(pool, replay, warmup_frame)
+            del pool
+            sweep.append({'interpreters': num_interpreters, 'num_threads': num_threads, 'fps': round(fps, 2)})
+            print('{:>12} {:>8} {:>10.2f}'.format(num_interpreters, num_threads, fps))
+finally:
+    if temporary is not None:
+        os.remove(temporary.name)
+
+best = max(sweep, key=lambda result: result['fps'])
+tuning = {
+    'model': PATH_TO_CKPT,
+    'backend': args.backend,
+    'machine': platform.machine(),
+    'node': platform.node(),
+    'cpu_count': os.cpu_count(),
+    'resolution': args.resolution,
+    'interpreters': best['interpreters'],
+    'num_threads': best['num_threads'],
+    # Every configuration ran through the Pipeline, the scripts have to as well
+    'pipeline': True,
+    'fps': best['fps'],
+    'sweep': sweep,
+}
+save_tuning(PATH_TO_TUNING, tuning)
+
+print('Best: {} interpreters x {} threads at {:.2f} FPS, recorded in {}'.format(
+    best['interpreters'], best['num_threads'], best['fps'], PATH_TO_TUNING))
@@ -0,0 +1,112 @@
+######## Model zoo benchmark #########
+#
+# Description:
+# Loads every model of the zoo in turn, warms it up and runs the same fixed
+# set of synthetic frames through it. For every model it reports the load
+# time, the peak resident memory, the p50/p95/p99 latency of invoke() alone
+# and the end-to-end FPS of preprocess -> invoke -> decode -> postprocess.
+# Results are printed as a table and recorded as JSON, so numbers from
+# different devices and runtime versions can be compared. With --replay the
+# frames come from a recording instead.
+#
+# Each model runs in its own child process, so memory used by one model does
+# not show up in the peak RSS of the next.
+#
+# Example:
+# python benchmark.py --frames 200 --threads 4 --output benchmark_pi4.json
+# python benchmark.py --models mobilenet/detect.tflite "yolov5-openvino-tflite-onnx/openvino/YOLOv5 FP16/model_float32.xml"
+
+# Import packages
+import os
+import argparse
+import json
+import platform
+
+from visa import BACKENDS
+from visa.benchmark import benchmark_isolated
+
+# The TFLite models shipped in this repository
+ZOO_MODELS = [
+    os.path.join('yolov5-openvino-tflite-onnx', 'model_dynamic_range_quant.tflite'),
+    os.path.join('yolov5-openvino-tflite-onnx', 'model_float16_quant.tflite'),
+    os.path.join('yolov5-openvino-tflite-onnx', 'model_full_integer_quant.tflite'),
+    os.path.join('yolov5-openvino-tflite-onnx', 'model_integer_quant.tflite'),
+    os.path.join('yolov5-openvino-tflite-onnx', 'model_weight_quant.tflite'),
+    os.path.join('mobilenet', 'detect.tflite'),
+]
+
+COLUMNS = ('model', 'load_s', 'peak_rss_mb', 'p50_ms', 'p95_ms', 'p99_ms', 'fps')
+
+
+def print_table(results):
+    width = max(len(os.path.relpath(result['model'])) for result in results)
+    print('{:<{w}} {:>8} {:>12} {:>9} {:>9} {:>9} {:>8}'.format(*COLUMNS, w=width))
+    for result in results:
+        model = os.path.relpath(result['model'])
+        if 'error' in result:
+            print('{:<{w}} {}'.format(model, result['error'], w=width))
+            continue
+        print('{:<{w}} {:>8.3f} {:>12.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>8.2f}'.format(
+            model, *[result[column] for column in COLUMNS[1:]], w=width))
+
+
+def main():
+    # Define and parse input arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', help='Model files to benchmark, defaults to every model of the zoo',
+                        nargs='+', default=ZOO_MODELS)
+    parser.add_argument('--backend', help='Inference backend, auto picks it from the model file extension (.tflite, .xml, .onnx)',
+                        choices=('auto',) + BACKENDS, default='auto')
+    parser.add_argument('--replay', help='Video file, image directory or .npy frame dump to take the frames from, synthetic frames if not given',
+                        default=None)
+    parser.add_argument('--resolution', help='Resolution of the frames in WxH',
+                        default='1280x720')
+    parser.add_argument('--frames', help='Number of timed frames per model',
+                        default=100)
+    parser.add_argument('--warmup', help='Number of untimed frames run before measuring',
+                        default=10)
+    parser.add_argument('--threads', help='Number of CPU threads per interpreter, runtime default if not given',
+                        default=None)
+    parser.add_argument('--output', help='Where to record the results as JSON',
+                        default='benchmark.json')
+    parser.add_argument('--timeout', help='Seconds after which a model that has not finished is recorded as failed',
+                        default=600)
+
+    args = parser.parse_args()
+
+    resW, resH = args.resolution.split('x')
+    imW, imH = int(resW), int(resH)
+    num_threads = int(args.threads) if args.threads else None
+
+    print('Benchmarking {} models on {} ({} CPUs), {} frames at {}'.format(
+        len(args.models), platform.machine(), os.cpu_count(), args.frames, args.resolution))
+
+    results = []
+    for model in args.models:
+        print('Running {}...'.format(model))
+        results.append(benchmark_isolated(os.path.join(os.getcwd(), model), int(args.frames), imW, imH,
+                                          warmup=int(args.warmup), replay=args.replay, num_threads=num_threads,
+                                          timeout=float(args.timeout), backend=args.backend))
+
+    print_table(results)
+
+    report = {
+        'machine': platform.machine(),
+        'node': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'resolution': args.resolution,
+        'replay': args.replay,
+        'frames': int(args.frames),
+        'warmup': int(args.warmup),
+        'num_threads': num_threads,
+        'backend': args.backend,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results recorded in {}'.format(args.output))
+
+
+# Child processes may re-import this script, so only run when executed directly
+if __name__ == '__main__':
+    main()
@@ -1,71 +1,178 @@
+# Connection manager for the STLB250 haptic devices.
+#
+# Up to max_devices units (e.g. one on each wrist) are kept connected at the
+# same time, keyed by address. The addresses of the last devices connected to
+# are kept in a small file, so after a restart or a dropout the manager first
+# connects to them directly; an address that fails to connect is dropped from
+# the file. Only when that fails does it scan, with a filter on the device
+# name or service UUID that returns as soon as a device that is not connected
+# yet advertises. Failed attempts are retried with exponential backoff,
+# bounded so a device that comes back is found again quickly.
+
 import asyncio
+import os
+import time
 
-from bleak import BleakClient, discover
+from bleak import BleakClient, BleakScanner
 
-address = (
-     "C0:CC:BB:AA:AA:AA"
-)
+DEVICE_NAME = "STLB250"
+ADDRESS_CACHE = os.path.expanduser("~/.visa_ble_address")
 
-devices_dict = {}
-devices_list = []
 receive_data = []
 
 class Connection:
-    
-    client: BleakClient = None
-    
+
     def __init__(
         self,
         loop: asyncio.AbstractEventLoop,
+        max_devices: int = 1,
+        name: str = DEVICE_NAME,
+        service_uuid: str = None,
+        address_cache: str = ADDRESS_CACHE,
+        scan_timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        min_backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        notify: dict = None,
     ):
+        """
+        max_devices -- devices kept connected at the same time
+        name, service_uuid -- a scanned device matching either is connected to
+        address_cache -- file the last connected addresses are kept in, None to not keep them
+        scan_timeout -- longest a single scan waits for the device to advertise
+        connect_timeout -- longest a single connection attempt takes
+        min_backoff, max_backoff -- seconds between failed attempts, doubled after each
+        notify -- characteristic uuid to notification handler, subscribed on every device
+        """
         self.loop = loop
-        self.connected = False
-       
-    def on_disconnect(self, client: BleakClient, future: asyncio.Future):
-        self.connected = False
-        print(f"Disconnected from {devices_list}!")
+        self.max_devices = max(1, int(max_devices))
+        self.name = name
+        self.service_uuid = service_uuid.lower() if service_uuid else None
+        self.address_cache = address_cache
+        self.scan_timeout = scan_timeout
+        self.connect_timeout = connect_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.notify = notify or {}
+        self.addresses = self._load_addresses()
+        self.changed = None
+
+        # Connected clients by address
+        self.clients = {}
+
+        # Connections made, and seconds the last one took since the device was lost
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    @property
+    def connected(self):
+        return bool(self.clients)
+
+    def on_disconnect(self, client: BleakClient, *args):
+        self.clients.pop(client.address, None)
+        print(f"Disconnected from {client.address}!")
+        if self.changed is not None:
+            self.changed.set()
 
     async def cleanup(self):
-        if self.client:
-            await self.client.disconnect()
+        clients = list(self.clients.values())
+        await asyncio.gather(*[client.disconnect() for client in clients], return_exceptions=True)
 
     async def manager(self):
         print("Starting connection manager.")
+        self.changed = asyncio.Event()
+        backoff = self.min_backoff
+        lost = time.monotonic()
         while True:
-            if self.client:
-                await self.connect()
+            if len(self.clients) >= self.max_devices:
+                # All devices connected, wait for one to drop
+                await self.changed.wait()
+                self.changed.clear()
+                lost = time.monotonic()
+                continue
+            address = await self.connect()
+            if address is not None:
+                self.connects += 1
+                self.connect_seconds = time.monotonic() - lost
+                print(f"Connected to {address} in {self.connect_seconds:.1f} s")
+                backoff = self.min_backoff
+                lost = time.monotonic()
             else:
-                await self.scan()
-                await asyncio.sleep(2.0)       
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
 
     async def connect(self):
-        if self.connected:
-            return
+        """One attempt to connect one more device, the cached addresses first and then a filtered scan
+
+        Returns the address connected to, or None.
+        """
+        for address in list(self.addresses):
+            if address in self.clients:
+                continue
+            if await self._connect(address):
+                return address
+            # Found again by the scan if it is still around
+            self._forget_address(address)
+        device = await self.scan()
+        if device is not None and await self._connect(device):
+            self._save_address(device.address)
+            return device.address
+        return None
+
+    async def _connect(self, device):
+        client = BleakClient(device, loop=self.loop)
         try:
-            await self.client.connect()
-            self.connected = await self.client.is_connected()
-            if self.connected:
-                print(F"Connected to {devices_list}")
-                self.client.set_disconnected_callback(self.on_disconnect)
-                while True:
-                    if not self.connected:
-                        break
-                    await asyncio.sleep(3.0)
-            else:
-                print(f"Failed to connect to {devices_list}")
+            await client.connect(timeout=self.connect_timeout)
+            connected = await client.is_connected()
         except Exception as e:
-            print(e)
+            print(f"Failed to connect to {getattr(device, 'address', device)}: {e}")
+            connected = False
+        if not connected:
+            return False
+        client.set_disconnected_callback(self.on_disconnect)
+        for char_uuid, handler in self.notify.items():
+            try:
+                await client.start_notify(char_uuid, handler)
+            except Exception as e:
+                print(f"Could not subscribe to {char_uuid} on {client.address}: {e}")
+        self.clients[client.address] = client
+        return True
 
     async def scan(self):
         print('scanning...')
-        dev = await discover()
-        for i in range(0,len(dev)):
-            if dev[i].name == "STLB250":
-            #Print the devices discovered
-                print("[" + str(i) + "]" + dev[i].address,dev[i].name,dev[i].metadata["uuids"])
-                devices_dict[dev[i].address] = []
-                devices_dict[dev[i].address].append(dev[i].name)
-                devices_dict[dev[i].address].append(dev[i].metadata["uuids"])
-                devices_list.append(dev[i].address)
-                self.client = BleakClient(dev[i].address, loop=self.loop)
-                
+        device = await BleakScanner.find_device_by_filter(self._match, timeout=self.scan_timeout)
+        if device is not None:
+            print(device.address, device.name)
+        return device
+
+    def _match(self, device, advertisement_data):
+        if device.address in self.clients:
+            return False
+        if device.name == self.name:
+            return True
+        uuids = getattr(advertisement_data, 'service_uuids', None) or []
+        return self.service_uuid is not None and self.service_uuid in [u.lower() for u in uuids]
+
+    def _load_addresses(self):
+        if not self.address_cache or not os.path.exists(self.address_cache):
+            return []
+        with open(self.address_cache) as f:
+            return [line.strip() for line in f if line.strip()][:self.max_devices]
+
+    def _save_address(self, address):
+        # Most recent first, as many as there are devices
+        self.addresses = ([address] + [a for a in self.addresses if a != address])[:self.max_devices]
+        self._write_addresses()
+
+    def _forget_address(self, address):
+        self.addresses = [a for a in self.addresses if a != address]
+        self._write_addresses()
+
+    def _write_addresses(self):
+        if not self.address_cache:
+            return
+        try:
+            with open(self.address_cache, 'w') as f:
+                f.write(''.join(a + '\n' for a in self.addresses))
+        except OSError as e:
+            print(f"Could not cache the device addresses: {e}")
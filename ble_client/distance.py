@@ -0,0 +1,53 @@
+# Distance readings from the STLB250.
+#
+# The device notifies the distance characteristic whenever its range sensor
+# measures. The notification handler runs on the BLE event loop and only
+# rebinds one attribute to a new (distance, time) tuple, so the detection
+# thread can read the latest value at any time without taking a lock.
+#
+# Notifications follow the ST BlueST layout: a 2 byte timestamp followed by
+# the little-endian 16 bit distance in millimeters. A bare 2 byte payload is
+# read as the distance alone.
+
+import struct
+import time
+
+# Distance characteristic uuid
+DISTANCE_CHAR_UUID = "00140000-0001-11e1-ac36-0002a5d5c51b"
+
+
+def parse_distance(data):
+    """Distance in millimeters from a notification payload, None if it is too short"""
+    if len(data) >= 4:
+        return struct.unpack_from('<H', data, 2)[0]
+    if len(data) >= 2:
+        return struct.unpack_from('<H', data, 0)[0]
+    return None
+
+
+class DistanceSlot:
+    """Latest distance reading, written from the event loop and read from any thread"""
+
+    def __init__(self, max_age=1.0):
+        """
+        max_age -- seconds a reading is used for, older ones count as no reading
+        """
+        self.max_age = max_age
+        # (millimeters, time.monotonic()) of the latest reading
+        self.reading = None
+        self.received = 0
+
+    def notification_handler(self, sender, data):
+        """Callback for BleakClient.start_notify()"""
+        distance = parse_distance(data)
+        if distance is None:
+            return
+        self.reading = (distance, time.monotonic())
+        self.received += 1
+
+    def latest(self):
+        """Latest distance in millimeters, None without a recent reading"""
+        reading = self.reading
+        if reading is None or time.monotonic() - reading[1] > self.max_age:
+            return None
+        return reading[0]
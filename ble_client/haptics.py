@@ -0,0 +1,181 @@
+# Haptic command scheduler.
+#
+# The detection loop runs on its own thread while the BLE clients live on an
+# asyncio event loop. submit() hands every direction to the loop with
+# call_soon_threadsafe(), so the writer coroutine wakes up as soon as a
+# direction is produced instead of polling a shared queue.
+#
+# Every connected device has its own slot holding only its latest direction:
+# one that arrives while the device's previous write is in flight or its
+# minimum interval has not passed yet replaces it, so a device never receives
+# stale guidance. Devices are written concurrently and independently, so a
+# slow device does not hold back the others. A direction equal to the last
+# one written to a device is skipped until repeat_interval has passed, and
+# writes go without response when the characteristic allows it.
+
+import asyncio
+import time
+
+
+class _Device:
+    """Write state of one connected device"""
+
+    def __init__(self, client, char_uuid):
+        self.client = client
+        self.busy = False
+        self.last_direction = None
+        self.last_write = -float('inf')
+
+        # Write without response when the characteristic supports it
+        self.response = True
+        try:
+            characteristic = client.services.get_characteristic(char_uuid)
+            self.response = 'write-without-response' not in characteristic.properties
+        except Exception:
+            pass
+
+
+class HapticScheduler:
+    """Coalescing, rate-limited hand-off of haptic direction codes to the connected devices"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, min_interval=0.05, repeat_interval=1.0,
+                 timings=None):
+        """
+        loop -- event loop the BLE clients run on
+        min_interval -- fewest seconds between two writes to a device, about the BLE connection interval
+        repeat_interval -- seconds before the same direction is written to a device again
+        timings -- optional visa.timings.StageTimings, records the 'haptic' stage
+                   from submit() until the write completed
+        """
+        self.loop = loop
+        self.min_interval = min_interval
+        self.repeat_interval = repeat_interval
+        self.timings = timings
+        self.connection = None
+
+        # Latest (direction, submit time) not written yet, by device address
+        self.pending = {}
+        self.wakeup = None
+        # Timer waking the writer when a device's minimum interval has passed, and its time.monotonic()
+        self.timer = None
+        self.timer_due = None
+
+        # Writes in flight, referenced until they complete so they are not collected
+        self.tasks = set()
+
+        # Write state by device address, replaced when a device reconnects
+        self.devices = {}
+
+        # Directions written, failed, replaced or repeated, and dropped while not connected
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def submit(self, direction, address=None):
+        """Make direction the next one written to a device, callable from any thread
+
+        address -- device to write to, every connected device if None
+        """
+        self.loop.call_soon_threadsafe(self._set, direction, time.perf_counter(), address)
+
+    def qsize(self):
+        return len(self.pending)
+
+    def _get_wakeup(self):
+        # Created on the loop thread, asyncio.Event binds to the current loop on older Pythons
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        return self.wakeup
+
+    def _set(self, direction, submitted, address):
+        if address is not None:
+            addresses = [address]
+        elif self.connection is not None:
+            addresses = list(self.connection.clients)
+        else:
+            addresses = []
+        if not addresses:
+            # Guidance is only useful live, do not replay it after connecting
+            self.dropped += 1
+            return
+        for address in addresses:
+            if address in self.pending:
+                self.coalesced += 1
+            self.pending[address] = (direction, submitted)
+        self._get_wakeup().set()
+
+    async def run(self, connection, char_uuid):
+        """Write the latest submitted directions to char_uuid of the connected devices"""
+        self.connection = connection
+        wakeup = self._get_wakeup()
+        try:
+            while True:
+                await wakeup.wait()
+                wakeup.clear()
+                self._write_pending(connection, char_uuid)
+        finally:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def _write_pending(self, connection, char_uuid):
+        # Seconds until the first device held back by min_interval may be written
+        retry = None
+        now = time.monotonic()
+        for address in list(self.pending):
+            client = connection.clients.get(address)
+            if client is None:
+                del self.pending[address]
+                self.dropped += 1
+                continue
+            device = self.devices.get(address)
+            if device is None or device.client is not client:
+                device = self.devices[address] = _Device(client, char_uuid)
+            if device.busy:
+                # Written when the write in flight completes
+                continue
+            delay = device.last_write + self.min_interval - now
+            if delay > 0:
+                # Directions submitted until then replace the pending one
+                retry = delay if retry is None else min(retry, delay)
+                continue
+
+            direction, submitted = self.pending.pop(address)
+            if (direction == device.last_direction
+                    and now - device.last_write < self.repeat_interval):
+                self.coalesced += 1
+                continue
+            device.busy = True
+            task = asyncio.ensure_future(self._write(device, char_uuid, direction, submitted))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        # One timer at a time, kept while it fires soon enough for the earliest device waiting
+        if retry is None:
+            return
+        if self.timer is not None:
+            if self.timer_due <= now + retry:
+                return
+            self.timer.cancel()
+        self.timer = self.loop.call_later(retry, self._on_timer)
+        self.timer_due = now + retry
+
+    def _on_timer(self):
+        self.timer = None
+        self.wakeup.set()
+
+    async def _write(self, device, char_uuid, direction, submitted):
+        try:
+            await device.client.write_gatt_char(char_uuid, bytes([direction]), response=device.response)
+            self.sent += 1
+            device.last_direction = direction
+            if self.timings is not None:
+                self.timings.since('haptic', submitted)
+        except Exception as e:
+            self.failed += 1
+            print('Haptic write to {} failed: {}'.format(device.client.address, e))
+        device.last_write = time.monotonic()
+        device.busy = False
+        # Send whatever was submitted for this device in the meantime
+        self.wakeup.set()
@@ -0,0 +1,184 @@
+# Simulated STLB250 haptic devices.
+#
+# SimulatedConnection has the interface of connect.Connection but connects to
+# in-process stand-ins for BleakClient instead of BlueZ, so the haptic path
+# can run on any machine, without bleak or a physical device. The stand-ins
+# model the connect delay, per-write latency with jitter, lost writes and
+# random disconnects, notify a wandering distance on every subscribed
+# characteristic, and record every command they receive with a timestamp.
+# Combined with --replay this measures frame-to-haptic latency end to end.
+
+import asyncio
+import json
+import random
+import struct
+import time
+
+
+class _Characteristic:
+    properties = ['read', 'write', 'write-without-response', 'notify']
+
+
+class _Services:
+    def get_characteristic(self, char_uuid):
+        return _Characteristic()
+
+
+class SimulatedClient:
+    """Stand-in for a BleakClient connected to a simulated device"""
+
+    def __init__(self, address, connection):
+        self.address = address
+        self.connection = connection
+        self.services = _Services()
+        self.connected = False
+        self.disconnected_callback = None
+        self.tasks = []
+
+    async def connect(self, timeout=None):
+        await asyncio.sleep(self.connection.connect_delay)
+        self.connected = True
+        interval = self.connection.disconnect_interval
+        if interval:
+            delay = self.connection.random.expovariate(1.0 / interval)
+            self.tasks.append(asyncio.ensure_future(self._disconnect_after(delay)))
+        return True
+
+    async def is_connected(self):
+        return self.connected
+
+    def set_disconnected_callback(self, callback):
+        self.disconnected_callback = callback
+
+    async def start_notify(self, char_uuid, handler):
+        if self.connection.distance_interval:
+            self.tasks.append(asyncio.ensure_future(self._notify_distance(char_uuid, handler)))
+
+    async def write_gatt_char(self, char_uuid, data, response=True):
+        if not self.connected:
+            raise ConnectionError('{} is not connected'.format(self.address))
+        connection = self.connection
+        latency = connection.write_latency * (1 + connection.jitter * (2 * connection.random.random() - 1))
+        await asyncio.sleep(max(0.0, latency))
+        if connection.random.random() < connection.drop_rate:
+            connection.lost += 1
+            if response:
+                raise ConnectionError('simulated write to {} lost'.format(self.address))
+            return
+        connection.commands.append((time.monotonic(), self.address, bytes(data), response))
+
+    async def disconnect(self):
+        if not self.connected:
+            return
+        self.connected = False
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def _disconnect_after(self, delay):
+        await asyncio.sleep(delay)
+        self.connection.disconnects += 1
+        await self.disconnect()
+
+    async def _notify_distance(self, char_uuid, handler):
+        # Random walk in millimeters, BlueST layout of a 2 byte timestamp and the distance
+        distance = 600.0
+        while self.connected:
+            await asyncio.sleep(self.connection.distance_interval)
+            distance = min(max(distance + self.connection.random.gauss(0, 40), 50), 1500)
+            timestamp = int(time.monotonic() * 1000) & 0xffff
+            handler(char_uuid, bytearray(struct.pack('<HH', timestamp, int(distance))))
+
+
+class SimulatedConnection:
+    """Keeps simulated devices connected, used in place of connect.Connection"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_devices=1, notify=None,
+                 connect_delay=0.5, write_latency=0.015, jitter=0.5, drop_rate=0.0,
+                 disconnect_interval=None, distance_interval=0.1, seed=None):
+        """
+        max_devices -- simulated devices kept connected at the same time
+        notify -- characteristic uuid to notification handler, subscribed on every device
+        connect_delay -- seconds every connection takes
+        write_latency -- mean seconds a write takes, varied by +-jitter of it
+        drop_rate -- fraction of writes lost, failing when written with response
+        disconnect_interval -- mean seconds a device stays connected, None to never drop
+        distance_interval -- seconds between distance notifications, None for none
+        seed -- seed of the random delays, drops and distances
+        """
+        self.loop = loop
+        self.max_devices = max(1, int(max_devices))
+        self.notify = notify or {}
+        self.connect_delay = connect_delay
+        self.write_latency = write_latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.disconnect_interval = disconnect_interval
+        self.distance_interval = distance_interval
+        self.random = random.Random(seed)
+        self.changed = None
+
+        # Connected clients by address
+        self.clients = {}
+        # (time.monotonic(), address, data, response) of every command received
+        self.commands = []
+
+        # Connections made and seconds the last one took, writes lost and disconnects
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.lost = 0
+        self.disconnects = 0
+
+    @property
+    def connected(self):
+        return bool(self.clients)
+
+    def on_disconnect(self, client, *args):
+        self.clients.pop(client.address, None)
+        print(f"Disconnected from {client.address}!")
+        if self.changed is not None:
+            self.changed.set()
+
+    async def cleanup(self):
+        clients = list(self.clients.values())
+        await asyncio.gather(*[client.disconnect() for client in clients], return_exceptions=True)
+
+    async def manager(self):
+        print("Starting simulated connection manager.")
+        self.changed = asyncio.Event()
+        lost = time.monotonic()
+        while True:
+            if len(self.clients) >= self.max_devices:
+                await self.changed.wait()
+                self.changed.clear()
+                lost = time.monotonic()
+                continue
+            index = next(i for i in range(self.max_devices + 1)
+                         if 'SIM:00:00:00:00:{:02X}'.format(i) not in self.clients)
+            client = SimulatedClient('SIM:00:00:00:00:{:02X}'.format(index), self)
+            await client.connect()
+            client.set_disconnected_callback(self.on_disconnect)
+            for char_uuid, handler in self.notify.items():
+                await client.start_notify(char_uuid, handler)
+            if not client.connected:
+                # Dropped while connecting
+                continue
+            self.clients[client.address] = client
+            self.connects += 1
+            self.connect_seconds = time.monotonic() - lost
+            print(f"Connected to {client.address} in {self.connect_seconds:.1f} s")
+            lost = time.monotonic()
+
+    def summary(self):
+        return 'commands {} lost {} connects {} disconnects {}'.format(
+            len(self.commands), self.lost, self.connects, self.disconnects)
+
+    def save(self, path):
+        """Write the received commands to path as JSON"""
+        commands = [{'time': t, 'address': address, 'data': list(data), 'response': response}
+                    for t, address, data, response in self.commands]
+        with open(path, 'w') as f:
+            json.dump({'commands': commands, 'lost': self.lost, 'connects': self.connects,
+                       'disconnects': self.disconnects}, f, indent=2)
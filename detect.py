@@ -23,53 +23,19 @@
 import os
 import argparse
 import cv2
-import numpy as np
 import sys
 import time
-from threading import Thread
-import importlib.util
-
-# Define VideoStream class to handle streaming of video from webcam in separate processing thread
-# Source - Adrian Rosebrock, PyImageSearch: https://www.pyimagesearch.com/2015/12/28/increasing-raspberry-pi-fps-with-python-and-opencv/
-class VideoStream:
-    """Camera object that controls video streaming from the Picamera"""
-    def __init__(self,resolution=(640,480),framerate=30):
-        # Initialize the PiCamera and the camera image stream
-        self.stream = cv2.VideoCapture(0)
-        ret = self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
-        ret = self.stream.set(3,resolution[0])
-        ret = self.stream.set(4,resolution[1])
-            
-        # Read first frame from the stream
-        (self.grabbed, self.frame) = self.stream.read()
-
-	# Variable to control when the camera is stopped
-        self.stopped = False
-
-    def start(self):
-	# Start the thread that reads frames from the video stream
-        Thread(target=self.update,args=()).start()
-        return self
-
-    def update(self):
-        # Keep looping indefinitely until the thread is stopped
-        while True:
-            # If the camera is stopped, stop the thread
-            if self.stopped:
-                # Close camera resources
-                self.stream.release()
-                return
-
-            # Otherwise, grab the next frame from the stream
-            (self.grabbed, self.frame) = self.stream.read()
 
-    def read(self):
-	# Return the most recent frame
-        return self.frame
-
-    def stop(self):
-	# Indicate that the camera and thread should be stopped
-        self.stopped = True
+from visa import BACKENDS, Detector, DetectorPool, Pipeline, VideoStream, load_tuning, postprocess
+from visa.labels import LabelMap
+from visa.metrics import MetricsRegistry, MetricsServer
+from visa.motion import MotionGatedDetector
+from visa.overlay import draw_detections, draw_framerate
+from visa.preview import Preview
+from visa.replay import REPLAY_RATES, open_replay
+from visa.roi import RoiDetector
+from visa.timings import StageTimings
+from visa.tracker import TrackingDetector
 
 # Define and parse input arguments
 parser = argparse.ArgumentParser()
@@ -77,6 +43,8 @@ parser.add_argument('--modeldir', help='Folder the .tflite file is located in',
                     required=True)
 parser.add_argument('--graph', help='Name of the .tflite file, if different than detect.tflite',
                     default='detect.tflite')
+parser.add_argument('--backend', help='Inference backend, auto picks it from the model file extension (.tflite, .xml, .onnx)',
+                    choices=('auto',) + BACKENDS, default='auto')
 parser.add_argument('--labels', help='Name of the labelmap file, if different than labelmap.txt',
                     default='labelmap.txt')
 parser.add_argument('--threshold', help='Minimum confidence threshold for displaying detected objects',
@@ -85,6 +53,50 @@ parser.add_argument('--resolution', help='Desired webcam resolution in WxH. If t
                     default='1280x720')
 parser.add_argument('--edgetpu', help='Use Coral Edge TPU Accelerator to speed up detection',
                     action='store_true')
+parser.add_argument('--threads', help='Number of CPU threads per interpreter',
+                    default=None)
+parser.add_argument('--interpreters', help='Number of pooled interpreters running frames concurrently, implies --pipeline',
+                    default=None)
+parser.add_argument('--tuning', help='Configuration recorded by autotune.py, used for --threads and --interpreters when not given, and turns on --pipeline',
+                    default=None)
+parser.add_argument('--pipeline', help='Run capture, preprocessing, inference and rendering as overlapping threaded stages',
+                    action='store_true')
+parser.add_argument('--queuesize', help='Capacity of each queue between pipeline stages',
+                    default=2)
+parser.add_argument('--nodrop', help='Block pipeline stages on a full queue instead of dropping the oldest frame',
+                    action='store_true')
+parser.add_argument('--headless', help='Run without a window and skip all drawing',
+                    action='store_true')
+parser.add_argument('--preview', help='Show a downscaled, rate-limited preview rendered in its own thread (Linux and Pi, not macOS)',
+                    action='store_true')
+parser.add_argument('--previewfps', help='Maximum frame rate of the --preview window',
+                    default=10)
+parser.add_argument('--previewscale', help='Scale factor applied to frames shown in the --preview window',
+                    default=0.5)
+parser.add_argument('--replay', help='Replay a video file, image directory or .npy frame dump instead of using the webcam',
+                    default=None)
+parser.add_argument('--replayrate', help='Replay at the recorded frame rate, or as fast as frames are processed without dropping any',
+                    choices=REPLAY_RATES, default='native')
+parser.add_argument('--loop', help='Restart the replay from the beginning when it ends',
+                    action='store_true')
+parser.add_argument('--statsinterval', help='Seconds between per-stage latency log lines, 0 to disable them',
+                    default=10)
+parser.add_argument('--stats', help='JSON file the per-stage latency snapshot is written to with every log line',
+                    default=None)
+parser.add_argument('--metricsport', help='Serve Prometheus metrics at http://127.0.0.1:PORT/metrics',
+                    default=None)
+parser.add_argument('--track', help='Run the model every N frames and track the boxes with optical flow in between',
+                    default=None)
+parser.add_argument('--motiongate', help='Reuse the previous result while less than this fraction of a downsampled frame changed, e.g. 0.02',
+                    default=None)
+parser.add_argument('--maxstale', help='Most consecutive frames a result is reused for by --motiongate',
+                    default=15)
+parser.add_argument('--roi', help='Run the model on a crop around the last detections instead of the full frame',
+                    action='store_true')
+parser.add_argument('--roimargin', help='Margin added around the detections cropped by --roi, as a fraction of their size',
+                    default=0.25)
+parser.add_argument('--roifull', help='Run --roi on the full frame at least every N frames',
+                    default=10)
 
 args = parser.parse_args()
 
@@ -95,19 +107,23 @@ min_conf_threshold = float(args.threshold)
 resW, resH = args.resolution.split('x')
 imW, imH = int(resW), int(resH)
 use_TPU = args.edgetpu
-
-# Import TensorFlow libraries
-# If tflite_runtime is installed, import interpreter from tflite_runtime, else import from regular tensorflow
-# If using Coral Edge TPU, import the load_delegate library
-pkg = importlib.util.find_spec('tflite_runtime')
-if pkg:
-    from tflite_runtime.interpreter import Interpreter
-    if use_TPU:
-        from tflite_runtime.interpreter import load_delegate
-else:
-    from tensorflow.lite.python.interpreter import Interpreter
-    if use_TPU:
-        from tensorflow.lite.python.interpreter import load_delegate
+use_pipeline = args.pipeline
+headless = args.headless
+use_preview = args.preview and not headless
+
+# Interpreter pool settings, falling back to the configuration recorded by autotune.py
+tuning = load_tuning(args.tuning) or {}
+num_threads = int(args.threads) if args.threads else tuning.get('num_threads')
+num_interpreters = int(args.interpreters) if args.interpreters else tuning.get('interpreters', 1)
+# The tuning was measured through the pipeline, so it only holds with the pipeline on
+if num_interpreters > 1 or tuning.get('pipeline'):
+    use_pipeline = True
+
+# Cropping, tracking and motion gating look at consecutive frames, so they run in the serial loop
+use_tracking = args.track and int(args.track) > 1
+use_motion_gate = args.motiongate is not None
+if args.roi or use_tracking or use_motion_gate:
+    use_pipeline = False
 
 # If using Edge TPU, assign filename for Edge TPU model
 if use_TPU:
@@ -125,121 +141,162 @@ PATH_TO_CKPT = os.path.join(CWD_PATH,MODEL_NAME,GRAPH_NAME)
 PATH_TO_LABELS = os.path.join(CWD_PATH,MODEL_NAME,LABELMAP_NAME)
 
 # Load the label map
-with open(PATH_TO_LABELS, 'r') as f:
-    labels = [line.strip() for line in f.readlines()]
+# The COCO "starter model" label map from https://www.tensorflow.org/lite/models/object_detection/overview
+# starts with a '???' placeholder, LabelMap drops it so class ids line up
+labels = LabelMap.load(PATH_TO_LABELS)
+
+# Rolling per-stage latencies, logged periodically
+timings = StageTimings(log_interval=float(args.statsinterval), snapshot_path=args.stats)
 
-# Have to do a weird fix for label map if using the COCO "starter model" from
-# https://www.tensorflow.org/lite/models/object_detection/overview
-# First label is '???', which has to be removed.
-if labels[0] == '???':
-    del(labels[0])
+# Metrics for the optional Prometheus endpoint; the hot loop only increments counters
+metrics = MetricsRegistry()
+metrics.stage_latencies(timings)
+detections_total = metrics.counter('detections_total', 'Detections kept after thresholding', label='class')
 
 # Load the Tensorflow Lite model.
-# If using Edge TPU, use special load_delegate argument
+# If using Edge TPU, the detector loads it with the special load_delegate argument.
+# YOLOv5 models are recognized by their single prediction output and decoded on the CPU.
+# OpenVINO IR and ONNX models run on their own CPU runtimes, see --backend.
+if num_interpreters > 1:
+    detector = DetectorPool(PATH_TO_CKPT, size=num_interpreters, num_threads=num_threads, use_tpu=use_TPU,
+                            score_threshold=min_conf_threshold, backend=args.backend, timings=timings)
+else:
+    detector = Detector(PATH_TO_CKPT, use_tpu=use_TPU, num_threads=num_threads,
+                        score_threshold=min_conf_threshold, backend=args.backend, timings=timings)
 if use_TPU:
-    interpreter = Interpreter(model_path=PATH_TO_CKPT,
-                              experimental_delegates=[load_delegate('libedgetpu.so.1.0')])
     print(PATH_TO_CKPT)
-else:
-    interpreter = Interpreter(model_path=PATH_TO_CKPT)
-
-interpreter.allocate_tensors()
 
-# Get model details
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-height = input_details[0]['shape'][1]
-width = input_details[0]['shape'][2]
-
-floating_model = (input_details[0]['dtype'] == np.float32)
-
-input_mean = 127.5
-input_std = 127.5
+# ROI mode: the model runs on a crop around the last confident detections
+if args.roi:
+    roi = RoiDetector(detector, class_ids=None, score_threshold=min_conf_threshold,
+                      margin=float(args.roimargin), full_frame_interval=int(args.roifull))
+    metrics.counter('roi_frames_total', 'Frames the model ran on in full or cropped to the last detections',
+                    label='region', fn=lambda: {'full': roi.full_frames, 'crop': roi.cropped})
+    detector = roi
+
+# Detect-then-track: the model only runs on every Nth frame, or when the tracker loses a box
+if use_tracking:
+    tracking = TrackingDetector(detector, interval=int(args.track), score_threshold=min_conf_threshold,
+                                class_ids=None, timings=timings)
+    metrics.counter('model_runs_total', 'Frames handled by running the model or by tracking', label='mode',
+                    fn=lambda: {'detect': tracking.detected, 'track': tracking.tracked})
+    detector = tracking
+
+# Motion gate: frames that barely changed reuse the previous result
+if use_motion_gate:
+    motion_gate = MotionGatedDetector(detector, threshold=float(args.motiongate), max_stale=int(args.maxstale))
+    metrics.counter('motion_gate_frames_total', 'Frames the motion gate passed on or answered with the previous result',
+                    label='result', fn=lambda: {'run': motion_gate.inferred, 'skipped': motion_gate.skipped})
+    detector = motion_gate
 
 # Initialize frame rate calculation
 frame_rate_calc = 1
 freq = cv2.getTickFrequency()
-
-# Initialize video stream
-videostream = VideoStream(resolution=(imW,imH),framerate=30).start()
+t1 = cv2.getTickCount()
+
+# Initialize video stream, from the webcam or a recording
+source = open_replay(args.replay, rate=args.replayrate, loop=args.loop) if args.replay else None
+# Capture into a fixed pool of buffers sized for the frames in flight
+pool_size = Pipeline.pool_size(int(args.queuesize), num_interpreters) if use_pipeline else 4
+videostream = VideoStream(resolution=(imW,imH),framerate=30,pool_size=pool_size,source=source).start()
+metrics.counter('frames_captured_total', 'Frames read from the camera or replay', fn=lambda: videostream.seq)
+metrics.counter('frames_dropped_total', 'Captured frames the detector never saw', fn=lambda: videostream.dropped)
+metrics.counter('frames_processed_total', 'Frames that went through detection', fn=lambda: timings.counts['frame'])
+if args.metricsport:
+    MetricsServer(metrics, port=int(args.metricsport)).start()
 time.sleep(1)
 
-# Create window
-cv2.namedWindow('Object detector', cv2.WINDOW_NORMAL)
-
-#for frame1 in camera.capture_continuous(rawCapture, format="bgr",use_video_port=True):
-while True:
-
-    # Start timer (for calculating frame rate)
-    t1 = cv2.getTickCount()
-
-    # Grab frame from video stream
-    frame1 = videostream.read()
-
-    # Acquire frame and resize to expected shape [1xHxWx3]
-    frame = frame1.copy()
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    frame_resized = cv2.resize(frame_rgb, (width, height))
-    input_data = np.expand_dims(frame_resized, axis=0)
-
-    # Normalize pixel values if using a floating model (i.e. if model is non-quantized)
-    if floating_model:
-        input_data = (np.float32(input_data) - input_mean) / input_std
-
-    # Perform the actual detection by running the model with the image as input
-    interpreter.set_tensor(input_details[0]['index'],input_data)
-    interpreter.invoke()
-
-    # Retrieve detection results
-    boxes = interpreter.get_tensor(output_details[0]['index'])[0] # Bounding box coordinates of detected objects
-    classes = interpreter.get_tensor(output_details[1]['index'])[0] # Class index of detected objects
-    scores = interpreter.get_tensor(output_details[2]['index'])[0] # Confidence of detected objects
-    #num = interpreter.get_tensor(output_details[3]['index'])[0]  # Total number of detected objects (inaccurate and not needed)
-
-    # Loop over all detections and draw detection box if confidence is above minimum threshold
-    for i in range(len(scores)):
-        if ((scores[i] > min_conf_threshold) and (scores[i] <= 1.0)):
-
-            # Get bounding box coordinates and draw box
-            # Interpreter can return coordinates that are outside of image dimensions, need to force them to be within image using max() and min()
-            ymin = int(max(1,(boxes[i][0] * imH)))
-            xmin = int(max(1,(boxes[i][1] * imW)))
-            ymax = int(min(imH,(boxes[i][2] * imH)))
-            xmax = int(min(imW,(boxes[i][3] * imW)))
-            
-            cv2.rectangle(frame, (xmin,ymin), (xmax,ymax), (10, 255, 0), 2)
-            
-            # Draw label
-            object_name = labels[int(classes[i])] # Look up object name from "labels" array using class index
-            label = '%s: %d%%' % (object_name, int(scores[i]*100)) # Example: 'person: 72%'
-            labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2) # Get font size
-            label_ymin = max(ymin, labelSize[1] + 10) # Make sure not to draw label too close to top of window
-            cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), (xmin+labelSize[0], label_ymin+baseLine-10), (255, 255, 255), cv2.FILLED) # Draw white box to put label text in
-            cv2.putText(frame, label, (xmin, label_ymin-7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2) # Draw label text
-
-            # Draw circle in center
-            xcenter = xmin + (int(round((xmax - xmin) / 2)))
-            ycenter = ymin + (int(round((ymax - ymin) / 2)))
-            cv2.circle(frame, (xcenter, ycenter), 5, (0,0,255), thickness=-1)
-
-            # Print info
-            print('Object ' + str(i) + ': ' + object_name + ' at (' + str(xcenter) + ', ' + str(ycenter) + ')')
-
-    # Draw framerate in corner of frame
-    cv2.putText(frame,'FPS: {0:.2f}'.format(frame_rate_calc),(30,50),cv2.FONT_HERSHEY_SIMPLEX,1,(255,255,0),2,cv2.LINE_AA)
+# Create window, or a preview rendered in its own thread
+preview = None
+if use_preview:
+    preview = Preview(labels, max_fps=float(args.previewfps), scale=float(args.previewscale)).start()
+elif not headless:
+    cv2.namedWindow('Object detector', cv2.WINDOW_NORMAL)
+
+def handle_detections(frame, detections):
+    """Render stage: report the detections and draw them unless headless"""
+    global frame_rate_calc, t1
+
+    # Keep only confident detections, scaled to the frame
+    start = time.perf_counter()
+    results = postprocess(detections, imW, imH, min_conf_threshold)
+    timings.since('postprocess', start)
+
+    # Print info
+    for i, result in enumerate(results):
+        object_name = labels[result['class_id']]
+        detections_total.inc(object_name)
+        print('Object ' + str(i) + ': ' + object_name + ' at (' + str(result['xcenter']) + ', ' + str(result['ycenter']) + ')')
+
+    # Calculate framerate from the time since the previous frame was handled
+    t2 = cv2.getTickCount()
+    time1 = (t2-t1)/freq
+    frame_rate_calc = 1/time1
+    t1 = t2
+    timings.record('frame', time1)
+    timings.report()
+
+    if headless:
+        return True
+
+    start = time.perf_counter()
+    if preview is not None:
+        # The preview thread draws on its own downscaled copy
+        preview.submit(frame, results, frame_rate_calc)
+        timings.since('draw', start)
+        return not preview.quit_requested
+
+    # Draw directly on the captured frame, inference is already done with it
+    draw_detections(frame, results, labels)
+    draw_framerate(frame, frame_rate_calc)
+    start = timings.since('draw', start)
 
     # All the results have been drawn on the frame, so it's time to display it.
     cv2.imshow('Object detector', frame)
 
-    # Calculate framerate
-    t2 = cv2.getTickCount()
-    time1 = (t2-t1)/freq
-    frame_rate_calc= 1/time1
-
     # Press 'q' to quit
-    if cv2.waitKey(1) == ord('q'):
-        break
+    keep_running = cv2.waitKey(1) != ord('q')
+    timings.since('imshow', start)
+    return keep_running
+
+# Without a window, Ctrl+C is the way to stop
+try:
+    if use_pipeline:
+        # Overlap capture, preprocessing, inference and rendering in separate stages
+        pipeline = Pipeline(detector, videostream, handle_detections,
+                            queue_size=int(args.queuesize), drop_oldest=not args.nodrop, timings=timings)
+        metrics.counter('pipeline_dropped_total', 'Frames discarded between pipeline stages', fn=lambda: pipeline.dropped)
+        pipeline.run()
+    else:
+        #for frame1 in camera.capture_continuous(rawCapture, format="bgr",use_video_port=True):
+        last_seq = 0
+        start = time.perf_counter()
+        while True:
+            # Wait for a frame we have not processed yet
+            item = videostream.wait_for_frame(last_seq, timeout=1.0)
+            if item is None:
+                # A replay that ran out stops the stream
+                if videostream.stopped:
+                    break
+                continue
+            frame, last_seq, _ = item
+            timings.since('capture_wait', start)
+
+            # Run the detector on the borrowed frame, then draw on it and hand it back
+            detections = detector.detect(frame)
+            keep_running = handle_detections(frame, detections)
+            videostream.release(frame)
+            start = time.perf_counter()
+            if not keep_running:
+                break
+except KeyboardInterrupt:
+    pass
 
 # Clean up
-cv2.destroyAllWindows()
+if preview is not None:
+    preview.stop()
+elif not headless:
+    cv2.destroyAllWindows()
 videostream.stop()
+print('Capture stats: {}'.format(videostream.stats()))
+timings.report(force=True)
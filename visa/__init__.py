@@ -0,0 +1,7 @@
+from .backends import BACKENDS, load_backend, load_interpreter
+from .detector import Detector
+from .framepool import FramePool
+from .pipeline import Pipeline
+from .pool import DetectorPool, load_tuning, save_tuning
+from .postprocess import DETECTION_DTYPE, RESULT_DTYPE, postprocess
+from .videostream import VideoStream
@@ -0,0 +1,198 @@
+# Inference backends.
+#
+# The Detector talks to its model through the small subset of the TFLite
+# Interpreter API it needs: allocate_tensors, get_input_details,
+# get_output_details, tensor, set_tensor, invoke and get_tensor. The OpenVINO
+# and ONNX Runtime backends below implement that same subset, so the shipped
+# OpenVINO IR and ONNX artifacts run through the same preprocessing, YOLOv5 /
+# SSD decoding and post-processing as the TFLite models.
+#
+# Each backend imports its runtime only when selected, so none of them is a
+# hard dependency.
+
+import importlib.util
+import os
+
+import numpy as np
+
+BACKENDS = ('tflite', 'openvino', 'onnx')
+
+# Model file extension -> backend used when none is requested
+_EXTENSIONS = {
+    '.tflite': 'tflite',
+    '.xml': 'openvino',
+    '.onnx': 'onnx',
+}
+
+
+def detect_backend(model_path):
+    """Pick a backend from the model file extension, TFLite if unknown"""
+    extension = os.path.splitext(model_path)[1].lower()
+    return _EXTENSIONS.get(extension, 'tflite')
+
+
+def load_backend(model_path, backend=None, use_tpu=False, num_threads=None):
+    """Create an interpreter-like object for model_path on the requested backend
+
+    backend -- one of BACKENDS, or None / 'auto' to choose from the file extension
+    """
+    if backend in (None, 'auto'):
+        backend = detect_backend(model_path)
+    if use_tpu and backend != 'tflite':
+        raise ValueError('The Edge TPU is only supported by the tflite backend')
+
+    if backend == 'tflite':
+        return load_interpreter(model_path, use_tpu, num_threads)
+    if backend == 'openvino':
+        return OpenVINOInterpreter(model_path, num_threads)
+    if backend == 'onnx':
+        return ONNXInterpreter(model_path, num_threads)
+    raise ValueError('Unknown backend {!r}, expected one of {}'.format(backend, ', '.join(BACKENDS)))
+
+
+def load_interpreter(model_path, use_tpu=False, num_threads=None):
+    """Create a TFLite interpreter, preferring tflite_runtime over full tensorflow
+
+    num_threads sets the number of CPU threads the interpreter may use for its
+    kernels, None leaves the runtime default.
+    """
+    # If tflite_runtime is installed, import interpreter from tflite_runtime, else import from regular tensorflow
+    # If using Coral Edge TPU, import the load_delegate library
+    pkg = importlib.util.find_spec('tflite_runtime')
+    if pkg:
+        from tflite_runtime.interpreter import Interpreter
+        if use_tpu:
+            from tflite_runtime.interpreter import load_delegate
+    else:
+        from tensorflow.lite.python.interpreter import Interpreter
+        if use_tpu:
+            from tensorflow.lite.python.interpreter import load_delegate
+
+    # Only pass num_threads when asked for, older runtimes do not accept it
+    kwargs = {}
+    if num_threads:
+        kwargs['num_threads'] = num_threads
+
+    # If using Edge TPU, use special load_delegate argument
+    if use_tpu:
+        return Interpreter(model_path=model_path,
+                           experimental_delegates=[load_delegate('libedgetpu.so.1.0')], **kwargs)
+    return Interpreter(model_path=model_path, **kwargs)
+
+
+def _dim(d):
+    # Dynamic output dimensions come back as names or None, report them as -1
+    try:
+        return int(d)
+    except (TypeError, ValueError):
+        return -1
+
+
+class _InterpreterAdapter:
+    """Shared TFLite-style bookkeeping for runtimes with NCHW or NHWC float input
+
+    Subclasses set self.input_shape (as the runtime expects it) and
+    self.output_shapes, and implement _run(input_data) returning the outputs.
+    """
+
+    # Input tensor is index 0, outputs follow from 1 as in a typical TFLite model
+    input_index = 0
+
+    def _setup(self, input_shape, output_shapes):
+        self.input_shape = [int(d) for d in input_shape]
+        self.nchw = (len(self.input_shape) == 4 and self.input_shape[1] == 3 and self.input_shape[3] != 3)
+        if self.nchw:
+            _, _, height, width = self.input_shape
+        else:
+            _, height, width, _ = self.input_shape
+
+        # The Detector always fills an NHWC float32 buffer, transposed on invoke if needed
+        self._input = np.zeros((1, height, width, 3), dtype=np.float32)
+        self.output_shapes = [[_dim(d) for d in shape] for shape in output_shapes]
+        self._outputs = [None] * len(self.output_shapes)
+
+    def allocate_tensors(self):
+        pass
+
+    def get_input_details(self):
+        return [{
+            'index': self.input_index,
+            'shape': np.array(self._input.shape),
+            'dtype': np.float32,
+            'quantization': (0.0, 0),
+        }]
+
+    def get_output_details(self):
+        return [{
+            'index': i + 1,
+            'shape': np.array(shape),
+            'dtype': np.float32,
+            'quantization': (0.0, 0),
+        } for i, shape in enumerate(self.output_shapes)]
+
+    def tensor(self, index):
+        return lambda: self._input
+
+    def set_tensor(self, index, value):
+        np.copyto(self._input, value)
+
+    def invoke(self):
+        input_data = self._input
+        if self.nchw:
+            input_data = np.ascontiguousarray(input_data.transpose(0, 3, 1, 2))
+        self._outputs = self._run(input_data)
+
+    def get_tensor(self, index):
+        return np.array(self._outputs[index - 1], dtype=np.float32)
+
+
+class OpenVINOInterpreter(_InterpreterAdapter):
+    """OpenVINO CPU inference on an IR (.xml + .bin) model"""
+
+    def __init__(self, model_path, num_threads=None):
+        try:
+            from openvino import Core
+        except ImportError:
+            # OpenVINO 2022.x only exposes Core under openvino.runtime
+            from openvino.runtime import Core
+
+        core = Core()
+        config = {}
+        if num_threads:
+            config['INFERENCE_NUM_THREADS'] = str(num_threads)
+        self.compiled_model = core.compile_model(core.read_model(model_path), 'CPU', config)
+        self.request = self.compiled_model.create_infer_request()
+
+        self._setup(self.compiled_model.input(0).shape,
+                    [output.shape for output in self.compiled_model.outputs])
+
+    def _run(self, input_data):
+        self.request.infer({0: input_data})
+        return [self.request.get_output_tensor(i).data for i in range(len(self.output_shapes))]
+
+
+class ONNXInterpreter(_InterpreterAdapter):
+    """ONNX Runtime CPU inference on an .onnx model with a static input shape"""
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        if not all(isinstance(d, int) for d in model_input.shape):
+            raise ValueError('{} has a dynamic input shape {}, export it with a fixed size'.format(
+                model_path, model_input.shape))
+        self.input_name = model_input.name
+        self.input_cast = np.float16 if model_input.type == 'tensor(float16)' else None
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+        self._setup(model_input.shape, [output.shape for output in self.session.get_outputs()])
+
+    def _run(self, input_data):
+        if self.input_cast is not None:
+            input_data = input_data.astype(self.input_cast)
+        return self.session.run(self.output_names, {self.input_name: input_data})
@@ -0,0 +1,114 @@
+# Model benchmarking helpers used by benchmark.py.
+#
+# Every model is measured in its own child process, so the peak RSS reported
+# for it is not inflated by models loaded before it in the same run.
+
+import multiprocessing
+import queue
+import resource
+import time
+
+import numpy as np
+
+from .detector import Detector
+from .postprocess import postprocess
+from .replay import load_frames
+from .timings import latency_summary
+
+
+def synthetic_frames(count, width, height, seed=0):
+    """Deterministic noise frames, so every model and every run sees the same input"""
+    rng = np.random.RandomState(seed)
+    unique = [rng.randint(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(min(count, 16))]
+    return [unique[i % len(unique)] for i in range(count)]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def benchmark_model(model_path, frames, warmup=10, threshold=0.5, **detector_args):
+    """Load a model, warm it up and time it on every frame
+
+    Returns load time, invoke latency percentiles and end-to-end FPS over
+    preprocess -> invoke -> output decoding -> postprocess.
+    """
+    start = time.perf_counter()
+    detector = Detector(model_path, **detector_args)
+    load_s = time.perf_counter() - start
+
+    height, width = frames[0].shape[:2]
+
+    # Warm up so lazy allocation and first-run kernel setup are not measured
+    for i in range(warmup):
+        detector.detect(frames[i % len(frames)])
+
+    invoke_samples = []
+    start = time.perf_counter()
+    for frame in frames:
+        detector.preprocess(frame)
+        t1 = time.perf_counter()
+        detector.invoke()
+        invoke_samples.append(time.perf_counter() - t1)
+        postprocess(detector.outputs(), width, height, threshold)
+    total_s = time.perf_counter() - start
+
+    result = {
+        'model': model_path,
+        'input': '{}x{} {}'.format(detector.width, detector.height, np.dtype(detector.input_dtype).name),
+        'format': detector.output_format,
+        'load_s': round(load_s, 3),
+        'frames': len(frames),
+        'fps': round(len(frames) / total_s, 2),
+    }
+    result.update(latency_summary(invoke_samples))
+    return result
+
+
+def _child(results, model_path, num_frames, width, height, warmup, replay, detector_args):
+    try:
+        if replay:
+            frames = load_frames(replay, num_frames, width, height)
+        else:
+            frames = synthetic_frames(num_frames, width, height)
+        result = benchmark_model(model_path, frames, warmup, **detector_args)
+    except Exception as e:
+        result = {'model': model_path, 'error': '{}: {}'.format(type(e).__name__, e)}
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    results.put(result)
+
+
+def benchmark_isolated(model_path, num_frames, width, height, warmup=10, replay=None, timeout=None,
+                       **detector_args):
+    """Run benchmark_model() in a fresh child process
+
+    replay -- video file, image directory or .npy dump to take the frames from,
+              synthetic frames if None
+    timeout -- seconds after which a child that has not reported is killed, None to wait
+               as long as it is alive
+
+    A child that dies without reporting (a crashing delegate, the OOM killer) or
+    times out gives a result with an 'error' instead of blocking the caller.
+    """
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_child,
+                                    args=(results, model_path, num_frames, width, height, warmup, replay, detector_args))
+    child.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=0.5)
+        except queue.Empty:
+            if not child.is_alive():
+                # It may have reported right before exiting
+                try:
+                    result = results.get(timeout=0.5)
+                except queue.Empty:
+                    result = {'model': model_path, 'error': 'exited with code {}'.format(child.exitcode)}
+            elif deadline is not None and time.monotonic() > deadline:
+                child.kill()
+                result = {'model': model_path, 'error': 'timed out after {} s'.format(timeout)}
+    child.join()
+    return result
@@ -0,0 +1,167 @@
+# Shared detection engine used by detect.py, run_visa.py and logic.py.
+#
+# The interpreter setup, preprocessing, invoke and output parsing used to be
+# copy-pasted as module level globals in every entry point. They now live here
+# so the per-frame hot path can be profiled and optimized in one place.
+#
+# Given a visa.timings.StageTimings, detect() records how long preprocessing,
+# invoke and output decoding took for every frame.
+
+import time
+
+import cv2
+import numpy as np
+
+from .backends import load_backend
+from .postprocess import DETECTION_DTYPE
+from .yolo import decode_yolov5, dequantize, is_yolov5_output
+
+
+class Detector:
+    """Object detector that owns an interpreter and runs it on BGR frames
+
+    The interpreter is TFLite by default; OpenVINO IR (.xml) and ONNX (.onnx)
+    models run through the adapters in visa.backends, see load_backend().
+    """
+
+    input_mean = 127.5
+    input_std = 127.5
+
+    def __init__(self, model_path, use_tpu=False, zero_copy=True, num_threads=None,
+                 score_threshold=0.25, iou_threshold=0.45, max_detections=100, backend=None, timings=None):
+        self.model_path = model_path
+        self.timings = timings
+        self.zero_copy = zero_copy
+        self.interpreter = load_backend(model_path, backend, use_tpu, num_threads)
+        self.interpreter.allocate_tensors()
+
+        # Get model details
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.input_index = self.input_details[0]['index']
+        self.height = self.input_details[0]['shape'][1]
+        self.width = self.input_details[0]['shape'][2]
+
+        self.floating_model = (self.input_details[0]['dtype'] == np.float32)
+
+        self.input_dtype = self.input_details[0]['dtype']
+        self.input_quantization = self.input_details[0]['quantization']
+
+        # YOLOv5 exports take RGB scaled to [0, 1] and return one raw prediction
+        # tensor that is decoded and NMS-filtered on the CPU
+        self.output_format = 'yolov5' if is_yolov5_output(self.output_details) else 'ssd'
+        if self.output_format == 'yolov5':
+            self.input_mean = 0.0
+            self.input_std = 255.0
+        self.score_threshold = score_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+
+        # Zero-copy mode writes straight into the interpreter's own input buffer.
+        # tensor() returns a function handing out a fresh view each call; the view
+        # must not be held across invoke(), so only the function is kept.
+        # The BGR scratch frame is reused for every resize.
+        if self.zero_copy:
+            self._input_tensor = self.interpreter.tensor(self.input_index)
+        self._resized = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+        # Fully integer quantized models take int8 input, quantized through a float scratch
+        if self.input_dtype == np.int8:
+            self._quantize_scratch = np.empty((self.height, self.width, 3), dtype=np.float32)
+
+    def preprocess(self, frame):
+        """Resize a BGR frame to the model input shape [1xHxWx3] and load it into the interpreter"""
+        if self.zero_copy:
+            self.prepare(frame, out=self._input_tensor()[0])
+            return
+        if self.input_dtype == np.int8:
+            self.set_input(self.prepare(frame))
+            return
+
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        frame_resized = cv2.resize(frame_rgb, (self.width, self.height))
+        input_data = np.expand_dims(frame_resized, axis=0)
+
+        # Normalize pixel values if using a floating model (i.e. if model is non-quantized)
+        if self.floating_model:
+            input_data = (np.float32(input_data) - self.input_mean) / self.input_std
+
+        self.interpreter.set_tensor(self.input_index, input_data)
+
+    def prepare(self, frame, out=None):
+        """Convert a BGR frame into a [HxWx3] model input array without touching the interpreter
+
+        Writes into out when given, otherwise a new array is returned. Only one
+        thread may call prepare() at a time since the resize scratch is shared.
+        """
+        if out is None:
+            out = np.empty((self.height, self.width, 3), dtype=self.input_dtype)
+
+        # Resize before the color conversion so only the small frame is converted.
+        # Resize is per channel, so the result is identical to converting first.
+        cv2.resize(frame, (self.width, self.height), dst=self._resized)
+
+        if self.floating_model:
+            # Swap BGR -> RGB while casting into the float32 buffer, then normalize in place
+            np.copyto(out, self._resized[..., ::-1], casting='unsafe')
+            out -= self.input_mean
+            out /= self.input_std
+        elif self.input_dtype == np.int8:
+            # Normalize as for a float model, then quantize with the input's (scale, zero_point)
+            scale, zero_point = self.input_quantization
+            real = self._quantize_scratch
+            np.copyto(real, self._resized[..., ::-1], casting='unsafe')
+            real -= self.input_mean
+            real /= self.input_std * scale
+            real += zero_point
+            np.rint(real, out=real)
+            np.clip(real, -128, 127, out=real)
+            np.copyto(out, real, casting='unsafe')
+        else:
+            cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=out)
+        return out
+
+    def set_input(self, input_data):
+        """Load a [HxWx3] array produced by prepare() into the interpreter"""
+        if self.zero_copy:
+            np.copyto(self._input_tensor()[0], input_data)
+        else:
+            self.interpreter.set_tensor(self.input_index, np.expand_dims(input_data, axis=0))
+
+    def invoke(self):
+        """Run the model on the currently loaded input"""
+        self.interpreter.invoke()
+
+    def outputs(self):
+        """Read the output tensors into a DETECTION_DTYPE structured array"""
+        if self.output_format == 'yolov5':
+            detail = self.output_details[0]
+            pred = dequantize(self.interpreter.get_tensor(detail['index'])[0], detail['quantization'])
+            return decode_yolov5(pred, self.width, self.height, self.score_threshold,
+                                 self.iou_threshold, self.max_detections)
+
+        boxes = self.interpreter.get_tensor(self.output_details[0]['index'])[0] # Bounding box coordinates of detected objects
+        classes = self.interpreter.get_tensor(self.output_details[1]['index'])[0] # Class index of detected objects
+        scores = self.interpreter.get_tensor(self.output_details[2]['index'])[0] # Confidence of detected objects
+
+        detections = np.empty(len(scores), dtype=DETECTION_DTYPE)
+        detections['box'] = boxes
+        detections['class_id'] = classes
+        detections['score'] = scores
+        return detections
+
+    def detect(self, frame):
+        """Run the full preprocess -> invoke -> parse path on a single BGR frame"""
+        if self.timings is None:
+            self.preprocess(frame)
+            self.invoke()
+            return self.outputs()
+
+        start = time.perf_counter()
+        self.preprocess(frame)
+        start = self.timings.since('preprocess', start)
+        self.invoke()
+        start = self.timings.since('invoke', start)
+        detections = self.outputs()
+        self.timings.since('decode', start)
+        return detections
@@ -0,0 +1,56 @@
+# Fixed ring of preallocated frame buffers.
+#
+# The capture thread fills a free buffer in place (VideoCapture.read(image=...))
+# instead of getting a freshly allocated 1280x720x3 image from every read.
+# Consumers borrow a buffer with retain() and hand it back with release(); a
+# buffer is only refilled once nobody holds a reference to it.
+
+from threading import Lock
+
+import numpy as np
+
+
+class FramePool:
+    """Preallocated frame buffers with reference counts"""
+
+    def __init__(self, size, shape, dtype=np.uint8):
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self.refcounts = [0] * size
+        self.lock = Lock()
+        # Buffers are looked up by identity, they live as long as the pool
+        self._index = {id(buf): i for i, buf in enumerate(self.buffers)}
+        self._next = 0
+
+        # Number of times acquire() found every buffer borrowed
+        self.misses = 0
+
+    def acquire(self):
+        """Return a free buffer holding one reference, or None if all are borrowed"""
+        with self.lock:
+            for k in range(len(self.buffers)):
+                i = (self._next + k) % len(self.buffers)
+                if self.refcounts[i] == 0:
+                    self.refcounts[i] = 1
+                    self._next = i + 1
+                    return self.buffers[i]
+            self.misses += 1
+            return None
+
+    def retain(self, buf):
+        """Add a reference to a buffer; frames not owned by the pool are ignored"""
+        i = self._index.get(id(buf))
+        if i is not None and self.buffers[i] is buf:
+            with self.lock:
+                self.refcounts[i] += 1
+
+    def release(self, buf):
+        """Drop a reference to a buffer; frames not owned by the pool are ignored"""
+        i = self._index.get(id(buf))
+        if i is not None and self.buffers[i] is buf:
+            with self.lock:
+                self.refcounts[i] = max(0, self.refcounts[i] - 1)
+
+    def available(self):
+        """Number of buffers nobody currently holds"""
+        with self.lock:
+            return self.refcounts.count(0)
@@ -0,0 +1,93 @@
+# Guidance state.
+#
+# The entry points used to cache the target box by inserting its coordinates
+# at the front of a list on every sighting, so the list grew by four entries
+# per frame for as long as the device ran and a target that left the view was
+# remembered forever. GuidanceState keeps a fixed number of target boxes with
+# the time they were last seen, forgets them after a TTL, and steers every
+# hand towards its nearest live target, all computed as array operations.
+
+import time
+
+import numpy as np
+
+# Direction codes written to the haptic device
+GO_RIGHT = 1
+GO_LEFT = 2
+GO_UP = 3
+GO_DOWN = 4
+GO_FORWARD = 5
+
+DIRECTION_NAMES = {
+    GO_RIGHT: 'Go Right',
+    GO_LEFT: 'Go Left',
+    GO_UP: 'Go Up',
+    GO_DOWN: 'Go Down',
+    GO_FORWARD: 'Go Forward',
+}
+
+
+class GuidanceState:
+    """Recently seen target boxes and the direction each hand has to move in"""
+
+    def __init__(self, ttl=1.0, max_targets=4):
+        """
+        ttl -- seconds a target is remembered after it was last seen
+        max_targets -- most target boxes kept, the most confident ones win
+        """
+        self.ttl = ttl
+        self.max_targets = max_targets
+        # Rows of (xmin, xmax, ymin, ymax) in frame pixels, and when each was seen
+        self.boxes = np.zeros((max_targets, 4), dtype=np.int32)
+        self.seen = np.full(max_targets, -np.inf)
+
+    def live(self, now=None):
+        """Boolean mask of the cached targets seen within the TTL"""
+        now = time.monotonic() if now is None else now
+        return now - self.seen <= self.ttl
+
+    def update(self, results, is_target, is_hand, now=None):
+        """Cache this frame's targets and return the direction code for every guided hand
+
+        results -- RESULT_DTYPE rows of the frame
+        is_target, is_hand -- boolean masks over results
+        Hands with no live target get no direction.
+        """
+        now = time.monotonic() if now is None else now
+
+        targets = results[is_target]
+        if len(targets):
+            # A fresh sighting replaces the cache, the most confident targets first
+            targets = targets[np.argsort(-targets['score'])[:self.max_targets]]
+            count = len(targets)
+            self.boxes[:count, 0] = targets['xmin']
+            self.boxes[:count, 1] = targets['xmax']
+            self.boxes[:count, 2] = targets['ymin']
+            self.boxes[:count, 3] = targets['ymax']
+            self.seen[:] = -np.inf
+            self.seen[:count] = now
+
+        hands = results[is_hand]
+        live = self.live(now)
+        if not len(hands) or not live.any():
+            return np.empty(0, dtype=np.int32)
+
+        # Nearest live target to every hand, by squared center distance
+        boxes = self.boxes[live].astype(np.float32)
+        target_cx = (boxes[:, 0] + boxes[:, 1]) / 2
+        target_cy = (boxes[:, 2] + boxes[:, 3]) / 2
+        dx = hands['xcenter'][:, None] - target_cx[None, :]
+        dy = hands['ycenter'][:, None] - target_cy[None, :]
+        t_xmin, t_xmax, t_ymin, t_ymax = boxes[np.argmin(dx * dx + dy * dy, axis=1)].T
+
+        # Same precedence as the original per-box checks
+        forward = ((hands['xmin'] < t_xmin) & (hands['xmax'] > t_xmax)
+                   & (hands['ymin'] < t_ymin) & (hands['ymax'] > t_ymax))
+        directions = np.select(
+            [forward,
+             hands['xcenter'] < t_xmin,
+             hands['xcenter'] > t_xmax,
+             hands['ycenter'] < t_ymin,
+             hands['ycenter'] > t_ymax],
+            [GO_FORWARD, GO_RIGHT, GO_LEFT, GO_UP, GO_DOWN], default=0)
+        return directions[directions != 0].astype(np.int32)
@@ -0,0 +1,101 @@
+# Label maps and guidance roles.
+#
+# The entry points used to keep the label map as a plain list, compare class
+# names as strings for every detection and, in some scripts only, delete the
+# '???' placeholder of the COCO starter model. LabelMap loads a label map once
+# and applies that offset the same way everywhere; LabelRoles turns the hand
+# and target class names into integer class id arrays, so filtering is a
+# single np.isin over the class tensor. The target can be switched while the
+# detector runs.
+
+import numpy as np
+
+# The COCO SSD MobileNet label map starts with a placeholder for the background
+# class, which the TFLite postprocess op already leaves out of its class ids
+COCO_PLACEHOLDER = '???'
+
+
+class LabelMap:
+    """Class names indexed by the class ids a model returns"""
+
+    def __init__(self, names):
+        self.names = list(names)
+        # Name -> class id, the first occurrence wins if a name is listed twice
+        self.index = {}
+        for class_id, name in enumerate(self.names):
+            self.index.setdefault(name, class_id)
+
+    @classmethod
+    def load(cls, path):
+        """Read one class name per line, dropping a leading COCO '???' placeholder"""
+        with open(path, 'r') as f:
+            names = [line.strip() for line in f.readlines()]
+        while names and not names[-1]:
+            names.pop()
+        if names and names[0] == COCO_PLACEHOLDER:
+            names = names[1:]
+        return cls(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, class_id):
+        class_id = int(class_id)
+        if 0 <= class_id < len(self.names):
+            return self.names[class_id]
+        return 'class {}'.format(class_id)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def class_ids(self, names):
+        """Integer class ids of the given names, unknown names are left out"""
+        return np.array(sorted(self.index[name] for name in set(names) if name in self.index), dtype=np.int32)
+
+
+class LabelRoles:
+    """Class ids of the hand and the target the guidance logic steers it to"""
+
+    def __init__(self, labels, hand, target):
+        """
+        labels -- LabelMap of the model
+        hand, target -- class name, or list of class names, of each role
+        """
+        self.labels = labels
+        self.hand = []
+        self.target = []
+        self.hand_ids = self.target_ids = self.ids = np.empty(0, dtype=np.int32)
+        self.set_hand(hand)
+        self.set_target(target)
+
+    def set_hand(self, names):
+        """Change the hand class(es), takes effect from the next frame"""
+        self._assign('hand', names)
+
+    def set_target(self, names):
+        """Change the target class(es), takes effect from the next frame"""
+        self._assign('target', names)
+
+    def _assign(self, role, names):
+        if isinstance(names, str):
+            names = [names]
+        ids = self.labels.class_ids(names)
+        missing = [name for name in names if name not in self.labels.index]
+        if missing:
+            print('Warning: {} not in the label map'.format(', '.join(missing)))
+        setattr(self, role, list(names))
+        setattr(self, role + '_ids', ids)
+
+        # Rebind rather than update in place, readers on other threads see either set whole
+        self.ids = np.union1d(self.hand_ids, self.target_ids).astype(np.int32)
+
+    def is_hand(self, class_ids):
+        return np.isin(class_ids, self.hand_ids)
+
+    def is_target(self, class_ids):
+        return np.isin(class_ids, self.target_ids)
+
+
+def resolve_class_ids(class_ids):
+    """Current class ids of a LabelRoles (or anything with an ids attribute), or class_ids as given"""
+    return getattr(class_ids, 'ids', class_ids)
@@ -0,0 +1,155 @@
+# Prometheus metrics endpoint.
+#
+# An optional HTTP server on localhost serves the state of the running
+# detector in the Prometheus text exposition format at /metrics. It is meant
+# to stay enabled on unattended devices, so the hot loop only ever increments
+# plain counters; everything else (capture counters, queue depths, connection
+# state, latency histograms) is read from the objects that already track it
+# when the endpoint is scraped.
+#
+# Counters are incremented without a lock. Under the GIL an increment may
+# only be lost when two threads bump the same counter at the same instant,
+# which the scripts avoid by updating each counter from one thread.
+
+import math
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+from .timings import LATENCY_BUCKETS
+
+
+class Metric:
+    """One counter or gauge, optionally split by a single label
+
+    Values are either accumulated with inc() or, given fn, read from
+    fn() at scrape time. fn returns a number, or a dict of label value to
+    number for a labelled metric. A None value has no sample in the scrape.
+    """
+
+    def __init__(self, name, kind, help, label=None, fn=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.label = label
+        self.fn = fn
+        self.values = {}
+
+    def inc(self, label_value='', amount=1):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def samples(self):
+        values = self.fn() if self.fn is not None else self.values
+        if not isinstance(values, dict):
+            return [('', values)]
+        return sorted(values.items())
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self, prefix='visa_'):
+        self.prefix = prefix
+        self.metrics = []
+        self.timings = None
+
+    def counter(self, name, help, label=None, fn=None):
+        """Counter incremented with inc(), or read from fn() when scraped"""
+        return self._add(Metric(self.prefix + name, 'counter', help, label, fn))
+
+    def gauge(self, name, help, fn, label=None):
+        """Gauge read from fn() when scraped"""
+        return self._add(Metric(self.prefix + name, 'gauge', help, label, fn))
+
+    def stage_latencies(self, timings):
+        """Export the latency histograms kept by a visa.timings.StageTimings"""
+        self.timings = timings
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self.metrics):
+            try:
+                samples = [(label_value, value) for label_value, value in metric.samples()
+                           if value is not None]
+            except Exception:
+                # A source that is not ready yet (e.g. no connection) is left out of this scrape
+                continue
+            if not samples:
+                # Nothing to report yet (e.g. no distance reading)
+                continue
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for label_value, value in samples:
+                if metric.label:
+                    lines.append('{}{{{}="{}"}} {}'.format(
+                        metric.name, metric.label, _escape(label_value), _number(value)))
+                else:
+                    lines.append('{} {}'.format(metric.name, _number(value)))
+
+        if self.timings is not None:
+            lines.extend(self._render_histograms())
+        return '\n'.join(lines) + '\n'
+
+    def _render_histograms(self):
+        name = self.prefix + 'stage_latency_seconds'
+        lines = ['# HELP {} Time spent in each stage of the detection loop'.format(name),
+                 '# TYPE {} histogram'.format(name)]
+        for stage, buckets in list(self.timings.buckets.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (math.inf,), list(buckets)):
+                cumulative += count
+                lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name, stage, _number(bound), cumulative))
+            lines.append('{}_sum{{stage="{}"}} {}'.format(name, stage, _number(self.timings.totals[stage])))
+            lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, cumulative))
+        return lines
+
+
+class MetricsServer:
+    """Serves a MetricsRegistry at http://host:port/metrics from a daemon thread"""
+
+    def __init__(self, registry, port=9100, host='127.0.0.1'):
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                # Scrapes every few seconds would otherwise flood the console
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+
+    def start(self):
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
@@ -0,0 +1,52 @@
+# Motion-gated inference.
+#
+# While the wearer stands still, consecutive frames are nearly identical and
+# running the model again returns the same boxes. MotionGatedDetector compares
+# a tiny grayscale thumbnail of every frame with the one of the frame the
+# model last ran on, and hands back the previous result when only a small
+# fraction of pixels changed. After max_stale reused frames the model runs
+# regardless, so slow drift and lighting changes are picked up eventually.
+
+import cv2
+import numpy as np
+
+from .reuse import ReusingDetector
+
+
+class MotionGatedDetector(ReusingDetector):
+    """Skips the wrapped detector on frames that barely changed"""
+
+    def __init__(self, detector, threshold=0.02, max_stale=15, pixel_delta=12, width=64):
+        """
+        threshold -- fraction of thumbnail pixels that must change for the model to run
+        max_stale -- most consecutive frames the previous result is reused for
+        pixel_delta -- gray level difference for a thumbnail pixel to count as changed
+        width -- width in pixels of the thumbnail frames are compared on
+        """
+        super().__init__(detector)
+        self.threshold = threshold
+        self.max_stale = max_stale
+        self.pixel_delta = pixel_delta
+        self.width = width
+
+        # Thumbnails of the frame the model last ran on and of the current frame
+        self.reference = None
+        self.thumbnail = None
+
+    def _thumbnail(self, frame):
+        height = max(1, int(round(frame.shape[0] * self.width / frame.shape[1])))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def changed(self, thumbnail):
+        """Fraction of pixels that differ from the reference thumbnail by more than pixel_delta"""
+        return np.count_nonzero(cv2.absdiff(thumbnail, self.reference) > self.pixel_delta) / thumbnail.size
+
+    def should_reuse(self, frame):
+        self.thumbnail = self._thumbnail(frame)
+        return (self.reference is not None and self.stale < self.max_stale
+                and self.changed(self.thumbnail) < self.threshold)
+
+    def on_inference(self, frame):
+        # Compare against the frame the result belongs to, so slow motion still adds up
+        self.reference = self.thumbnail
@@ -0,0 +1,32 @@
+# Drawing of detection results onto a frame.
+#
+# Kept apart from detection and guidance so the entry points can draw straight
+# onto the borrowed capture buffer once inference is done with it, instead of
+# copying every frame up front just to have something to draw on.
+
+import cv2
+
+
+def draw_detections(frame, results, labels):
+    """Draw boxes, labels and center dots for RESULT_DTYPE rows onto frame in place"""
+    for result in results:
+        # Get bounding box coordinates and draw box
+        xmin, ymin, xmax, ymax = int(result['xmin']), int(result['ymin']), int(result['xmax']), int(result['ymax'])
+
+        cv2.rectangle(frame, (xmin,ymin), (xmax,ymax), (10, 255, 0), 2)
+
+        # Draw label
+        object_name = labels[result['class_id']] # Look up object name from "labels" array using class index
+        label = '%s: %d%%' % (object_name, int(result['score']*100)) # Example: 'person: 72%'
+        labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2) # Get font size
+        label_ymin = max(ymin, labelSize[1] + 10) # Make sure not to draw label too close to top of window
+        cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), (xmin+labelSize[0], label_ymin+baseLine-10), (255, 255, 255), cv2.FILLED) # Draw white box to put label text in
+        cv2.putText(frame, label, (xmin, label_ymin-7), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2) # Draw label text
+
+        # Draw circle in center
+        cv2.circle(frame, (int(result['xcenter']), int(result['ycenter'])), 5, (0,0,255), thickness=-1)
+
+
+def draw_framerate(frame, frame_rate_calc):
+    """Draw framerate in corner of frame"""
+    cv2.putText(frame,'FPS: {0:.2f}'.format(frame_rate_calc),(30,50),cv2.FONT_HERSHEY_SIMPLEX,1,(255,255,0),2,cv2.LINE_AA)
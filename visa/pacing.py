@@ -0,0 +1,40 @@
+# Distance-paced inference.
+#
+# The haptic device measures how far the hand is from what it points at. While
+# the hand is still far from the target, guidance changes slowly and running
+# the model on every frame buys little; once it comes close, every frame
+# counts. DistancePacedDetector reuses the previous result for up to max_skip
+# frames, scaled linearly from none at the near distance to max_skip at the
+# far one. Without a recent reading it runs the model on every frame.
+
+import numpy as np
+
+from .reuse import ReusingDetector
+
+
+class DistancePacedDetector(ReusingDetector):
+    """Runs the wrapped detector less often the farther away the hand is"""
+
+    def __init__(self, detector, distance, near=150, far=1000, max_skip=5):
+        """
+        distance -- callable returning the latest distance in millimeters, or None
+        near -- at or below this distance the model runs on every frame
+        far -- at or above this distance max_skip frames are skipped after every run
+        max_skip -- most consecutive frames the previous result is reused for
+        """
+        super().__init__(detector)
+        self.distance = distance
+        self.near = near
+        self.far = max(far, near + 1)
+        self.max_skip = max(0, int(max_skip))
+
+    def skip(self):
+        """Frames to reuse a result for at the current distance"""
+        distance = self.distance()
+        if distance is None:
+            return 0
+        fraction = np.clip((distance - self.near) / (self.far - self.near), 0.0, 1.0)
+        return int(round(fraction * self.max_skip))
+
+    def should_reuse(self, frame):
+        return self.stale < self.skip()
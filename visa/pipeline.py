@@ -0,0 +1,245 @@
+# Multi-stage threaded detection pipeline.
+#
+# Capture, preprocess and inference each run in their own thread and hand work
+# to the next stage through small bounded queues. The render stage runs on the
+# caller's thread, so handle_result can draw and show frames just like the
+# serial loop. OpenCV windows must be driven from one thread, and with the
+# Cocoa backend on macOS that has to be the main thread.
+# While frame N is inside interpreter.invoke(), frame N+1 is being resized and
+# frame N-1 is being drawn, so throughput is bounded by the slowest stage rather
+# than by the sum of all of them.
+#
+# Frames borrowed from the VideoStream are handed back once rendered, or as
+# soon as the drop-oldest policy discards them.
+#
+# Given a DetectorPool, one inference worker runs per pooled interpreter. Each
+# worker takes the next frame as soon as it is free, and results are put back
+# into capture order before they reach the render stage.
+#
+# When the VideoStream stops by itself, as a replayed recording does at its
+# end, the pipeline finishes the frames already in flight and returns. A
+# stream read in lockstep (a replay with rate 'fast') must not lose frames, so
+# every stage then blocks on a full queue instead of dropping the oldest item.
+#
+# Model inputs are prepared into a fixed ring of buffers sized for the items
+# that can be queued for or held by the inference workers. A buffer goes back
+# to the ring once set_input() has copied it into the interpreter, or when its
+# item is dropped, so no input array is allocated per frame.
+#
+# Given a visa.timings.StageTimings, every stage records its own latency. With
+# several inference workers only the first one records invoke and decode, as
+# the timings are written without a lock.
+
+import queue
+import time
+from threading import Event, Lock, Thread
+
+import numpy as np
+
+from .pool import DetectorPool
+
+
+class Pipeline:
+    """Runs capture -> preprocess -> infer -> render as overlapping stages"""
+
+    def __init__(self, detector, videostream, handle_result, queue_size=2, drop_oldest=True, timings=None):
+        """
+        detector -- visa.Detector, or a visa.DetectorPool to run one inference
+                    worker per interpreter
+        videostream -- visa.VideoStream (or anything with wait_for_frame()) to pull frames from
+        handle_result -- called as handle_result(frame, detections) on the caller's
+                         thread, returns False to stop the pipeline
+        queue_size -- capacity of each queue between stages
+        drop_oldest -- when a queue is full, discard its oldest item instead of
+                       blocking the producing stage, ignored for a lockstep stream
+        timings -- optional visa.timings.StageTimings to record stage latencies in
+        """
+        self.detector = detector
+        self.detectors = list(detector) if isinstance(detector, DetectorPool) else [detector]
+        self.videostream = videostream
+        self.handle_result = handle_result
+        self.drop_oldest = drop_oldest and not getattr(videostream, 'lockstep', False)
+        self.timings = timings
+
+        self.preprocess_queue = queue.Queue(maxsize=queue_size)
+        self.infer_queue = queue.Queue(maxsize=queue_size)
+        self.render_queue = queue.Queue(maxsize=queue_size)
+
+        # Free model input buffers
+        first = self.detectors[0]
+        self.free_inputs = queue.Queue()
+        for _ in range(self.input_pool_size(queue_size, len(self.detectors))):
+            self.free_inputs.put(np.empty((first.height, first.width, 3), dtype=first.input_dtype))
+
+        # Number of items discarded by the drop-oldest policy
+        self.dropped = 0
+
+        # Frames are numbered before inference and results released in that order
+        self.next_ticket = 0
+        self.next_result = 0
+        self.reorder = {}
+        self.reorder_lock = Lock()
+
+        # Frames between capture and the end of rendering or being dropped
+        self.in_flight = 0
+        self.in_flight_lock = Lock()
+        self.capture_done = Event()
+
+        self.stopped = Event()
+        self.threads = []
+
+    @staticmethod
+    def pool_size(queue_size, workers=1):
+        """Number of capture buffers needed to keep every stage fed"""
+        # Three queues, one frame held by capture, preprocess and render, one per
+        # inference worker plus up to workers - 1 waiting to be re-ordered,
+        # the stream's latest frame and the one being captured
+        return 3 * queue_size + 2 * workers + 4
+
+    @staticmethod
+    def input_pool_size(queue_size, workers=1):
+        """Number of model input buffers needed to keep the inference workers fed"""
+        # The infer queue, one held by every worker until set_input(), one being prepared
+        return queue_size + workers + 1
+
+    def start(self):
+        # Start the capture, preprocess and inference threads
+        stages = [(self._capture, ()), (self._preprocess, ())]
+        stages += [(self._infer, (detector,)) for detector in self.detectors]
+        for target, args in stages:
+            thread = Thread(target=target, args=args)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def run(self):
+        """Start the worker stages and render results until handle_result returns False"""
+        self.start()
+        try:
+            while not self.stopped.is_set():
+                item = self._get(self.render_queue)
+                if item is None:
+                    if self.capture_done.is_set() and self.in_flight == 0:
+                        break
+                    continue
+                frame, detections = item
+                keep_running = self.handle_result(frame, detections)
+                self.videostream.release(frame)
+                self._retire()
+                if keep_running is False:
+                    break
+        finally:
+            self.stop()
+
+    def stop(self):
+        # Indicate that the worker threads should finish and wait for them
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        self.threads = []
+
+    def _put(self, q, item):
+        while not self.stopped.is_set():
+            if self.drop_oldest:
+                try:
+                    q.put_nowait(item)
+                    return
+                except queue.Full:
+                    # Make room by discarding the stalest item
+                    try:
+                        stale = q.get_nowait()
+                        self.dropped += 1
+                        self.videostream.release(stale[0])
+                        self._retire()
+                        if q is self.infer_queue:
+                            self.free_inputs.put(stale[1])
+                            # Let the results after it through
+                            self._complete(stale[2], None)
+                    except queue.Empty:
+                        pass
+            else:
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+    def _get(self, q):
+        # Time out periodically so stop() is noticed
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            return None
+
+    def _capture(self):
+        last_seq = 0
+        start = time.perf_counter()
+        while not self.stopped.is_set():
+            # Block until the camera delivers a frame we have not queued yet
+            item = self.videostream.wait_for_frame(last_seq, timeout=0.1)
+            if item is None:
+                if getattr(self.videostream, 'stopped', False):
+                    # The stream ended, let the frames in flight drain
+                    self.capture_done.set()
+                    return
+                continue
+            frame, last_seq, _ = item
+            if self.timings is not None:
+                self.timings.since('capture_wait', start)
+            with self.in_flight_lock:
+                self.in_flight += 1
+            self._put(self.preprocess_queue, (frame,))
+            start = time.perf_counter()
+
+    def _preprocess(self):
+        while not self.stopped.is_set():
+            item = self._get(self.preprocess_queue)
+            if item is None:
+                continue
+            frame, = item
+            input_data = self._get(self.free_inputs)
+            while input_data is None and not self.stopped.is_set():
+                input_data = self._get(self.free_inputs)
+            if input_data is None:
+                return
+            start = time.perf_counter()
+            self.detector.prepare(frame, out=input_data)
+            if self.timings is not None:
+                self.timings.since('preprocess', start)
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self._put(self.infer_queue, (frame, input_data, ticket))
+
+    def _infer(self, detector):
+        timings = self.timings if detector is self.detectors[0] else None
+        while not self.stopped.is_set():
+            item = self._get(self.infer_queue)
+            if item is None:
+                continue
+            frame, input_data, ticket = item
+            start = time.perf_counter()
+            detector.set_input(input_data)
+            # The interpreter holds its own copy now
+            self.free_inputs.put(input_data)
+            detector.invoke()
+            if timings is not None:
+                start = timings.since('invoke', start)
+            detections = detector.outputs()
+            if timings is not None:
+                timings.since('decode', start)
+            self._complete(ticket, (frame, detections))
+
+    def _retire(self):
+        with self.in_flight_lock:
+            self.in_flight -= 1
+
+    def _complete(self, ticket, result):
+        # Hold results back until every earlier ticket has finished or been dropped
+        with self.reorder_lock:
+            self.reorder[ticket] = result
+            while self.next_result in self.reorder:
+                ready = self.reorder.pop(self.next_result)
+                self.next_result += 1
+                if ready is not None:
+                    self._put(self.render_queue, ready)
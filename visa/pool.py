@@ -0,0 +1,63 @@
+# Pool of interpreters for multi-core CPU inference.
+#
+# A single TFLite interpreter is used serially, so on a four core Pi one
+# invoke() at a time leaves cores idle between kernels. The pool creates N
+# Detectors on the same model file, each with num_threads kernel threads. The
+# TFLite runtime memory-maps the model file, so the interpreters share the
+# weights through the page cache rather than each holding a copy.
+#
+# The Pipeline runs one inference worker per pooled detector and re-orders
+# their results by sequence number before rendering.
+
+import json
+import os
+
+from .detector import Detector
+
+
+class DetectorPool:
+    """Several Detectors on one model, each owning its own interpreter"""
+
+    def __init__(self, model_path, size=2, num_threads=None, use_tpu=False, **detector_args):
+        """Any further keyword arguments are passed on to every Detector"""
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.detectors = [Detector(model_path, use_tpu=use_tpu, num_threads=num_threads, **detector_args)
+                          for _ in range(size)]
+
+        # Every interpreter has the same input shape, so any of them can prepare frames
+        first = self.detectors[0]
+        self.height = first.height
+        self.width = first.width
+        self.floating_model = first.floating_model
+        self._next = 0
+
+    def __len__(self):
+        return len(self.detectors)
+
+    def __iter__(self):
+        return iter(self.detectors)
+
+    def prepare(self, frame, out=None):
+        """Convert a BGR frame into a model input array, see Detector.prepare()"""
+        return self.detectors[0].prepare(frame, out)
+
+    def detect(self, frame):
+        """Run the next detector in round-robin order on a single frame"""
+        detector = self.detectors[self._next]
+        self._next = (self._next + 1) % len(self.detectors)
+        return detector.detect(frame)
+
+
+def load_tuning(path):
+    """Read the configuration recorded by autotune.py, or None if there is none"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_tuning(path, tuning):
+    """Record the configuration picked by autotune.py"""
+    with open(path, 'w') as f:
+        json.dump(tuning, f, indent=2)
@@ -0,0 +1,58 @@
+# Vectorized post-processing of raw detector output.
+#
+# Replaces the per-box Python loop in the entry points: thresholding, class
+# filtering, scaling to image size, clamping and center computation are done
+# as NumPy array operations over every detection at once.
+
+import numpy as np
+
+# One row per detection. Boxes are normalized [ymin, xmin, ymax, xmax] as
+# returned by the SSD MobileNet postprocess op.
+DETECTION_DTYPE = np.dtype([
+    ('box', np.float32, (4,)),
+    ('class_id', np.int32),
+    ('score', np.float32),
+])
+
+# One row per kept detection, in pixel coordinates of the source frame
+RESULT_DTYPE = np.dtype([
+    ('class_id', np.int32),
+    ('score', np.float32),
+    ('xmin', np.int32),
+    ('ymin', np.int32),
+    ('xmax', np.int32),
+    ('ymax', np.int32),
+    ('xcenter', np.int32),
+    ('ycenter', np.int32),
+])
+
+
+def postprocess(detections, imW, imH, min_conf_threshold, class_ids=None):
+    """Filter DETECTION_DTYPE rows and scale them into a RESULT_DTYPE array
+
+    detections -- structured array as returned by Detector.detect()
+    imW, imH -- size of the frame the boxes are mapped onto
+    min_conf_threshold -- detections must score above this to be kept
+    class_ids -- optional sequence of class ids to keep, all classes if None
+    """
+    scores = detections['score']
+    keep = (scores > min_conf_threshold) & (scores <= 1.0)
+    if class_ids is not None:
+        keep &= np.isin(detections['class_id'], class_ids)
+
+    kept = detections[keep]
+    boxes = kept['box']
+
+    results = np.empty(len(kept), dtype=RESULT_DTYPE)
+    results['class_id'] = kept['class_id']
+    results['score'] = kept['score']
+
+    # Interpreter can return coordinates that are outside of image dimensions, need to force them to be within image
+    results['ymin'] = np.maximum(1, boxes[:, 0] * imH)
+    results['xmin'] = np.maximum(1, boxes[:, 1] * imW)
+    results['ymax'] = np.minimum(imH, boxes[:, 2] * imH)
+    results['xmax'] = np.minimum(imW, boxes[:, 3] * imW)
+
+    results['xcenter'] = results['xmin'] + np.round((results['xmax'] - results['xmin']) / 2)
+    results['ycenter'] = results['ymin'] + np.round((results['ymax'] - results['ymin']) / 2)
+    return results
@@ -0,0 +1,91 @@
+# Rate-limited preview window rendered in its own thread.
+#
+# Drawing boxes, cv2.imshow and cv2.waitKey cost real milliseconds per frame on
+# a Pi. The preview only takes a downscaled copy of at most max_fps frames per
+# second and does all drawing and GUI work on its own thread, so the detection
+# and haptic path never waits on the window.
+#
+# Every window call is made from that one thread. The GTK and Qt HighGUI
+# backends used on Linux and the Pi accept this; the Cocoa backend on macOS
+# only drives windows from the main thread, so use the plain window there.
+
+import time
+from threading import Condition, Thread
+
+import cv2
+import numpy as np
+
+from .overlay import draw_detections, draw_framerate
+
+# Result fields holding pixel coordinates, rescaled along with the frame
+_COORDINATE_FIELDS = ('xmin', 'ymin', 'xmax', 'ymax', 'xcenter', 'ycenter')
+
+
+class Preview:
+    """Shows detection results in a window at a capped frame rate"""
+
+    def __init__(self, labels, max_fps=10, scale=0.5, window_name='Object detector'):
+        self.labels = labels
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.scale = scale
+        self.window_name = window_name
+
+        # Latest submitted frame, picked up by the preview thread
+        self.condition = Condition()
+        self.pending = None
+        self.last_submit = 0.0
+
+        # Set when 'q' is pressed in the preview window
+        self.quit_requested = False
+        self.stopped = False
+
+    def start(self):
+        # Start the thread that draws and shows the preview
+        thread = Thread(target=self.update, args=())
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def submit(self, frame, results, frame_rate_calc):
+        """Offer a frame for display; returns immediately and skips frames over the rate cap"""
+        now = time.monotonic()
+        if now - self.last_submit < self.min_interval:
+            return
+        self.last_submit = now
+
+        # The downscaled copy lets the caller release or reuse its frame right away
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        scaled = results.copy()
+        for field in _COORDINATE_FIELDS:
+            scaled[field] = np.round(scaled[field] * self.scale)
+
+        with self.condition:
+            self.pending = (small, scaled, frame_rate_calc)
+            self.condition.notify()
+
+    def update(self):
+        cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None or self.stopped, timeout=0.1)
+                if self.stopped:
+                    break
+                item, self.pending = self.pending, None
+
+            if item is not None:
+                small, results, frame_rate_calc = item
+                draw_detections(small, results, self.labels)
+                draw_framerate(small, frame_rate_calc)
+                cv2.imshow(self.window_name, small)
+
+            # Keep the window responsive even when no new frame arrived
+            if cv2.waitKey(1) == ord('q'):
+                self.quit_requested = True
+
+        cv2.destroyWindow(self.window_name)
+
+    def stop(self):
+        # Indicate that the preview thread should close its window and finish
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
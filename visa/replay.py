@@ -0,0 +1,225 @@
+# Offline replay of recorded frames.
+#
+# A ReplaySource stands in for cv2.VideoCapture(0) in the VideoStream, so the
+# whole detection loop can run without a camera on a video file, a directory
+# of images or a .npy dump of frames shaped [N, H, W, 3] (BGR, uint8).
+#
+# Frames are replayed at their native rate, or as fast as possible. In the
+# latter case the VideoStream hands every frame to the consumer exactly once
+# instead of dropping the ones it did not keep up with, so repeated runs see
+# the same frames and measure the same work. With loop the source rewinds at
+# the end, otherwise it reports that it is finished and the stream stops.
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+REPLAY_RATES = ('native', 'fast')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def open_replay(path, rate='native', loop=False, fps=30):
+    """Open a video file, image directory or .npy frame dump for replay
+
+    fps -- playback rate of image directories and .npy dumps at native rate,
+           video files use the rate recorded in the file
+    """
+    if rate not in REPLAY_RATES:
+        raise ValueError('Unknown replay rate {!r}, expected one of {}'.format(rate, ', '.join(REPLAY_RATES)))
+    if os.path.isdir(path):
+        return ImageDirectorySource(path, rate, loop, fps)
+    if path.lower().endswith('.npy'):
+        return NumpySource(path, rate, loop, fps)
+    return VideoFileSource(path, rate, loop, fps)
+
+
+def load_frames(path, count, width, height):
+    """Read count frames of a replay source resized to width x height, looping if it is shorter"""
+    source = open_replay(path, rate='fast', loop=True)
+    source.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    source.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    frames = []
+    for _ in range(count):
+        grabbed, frame = source.read()
+        if not grabbed:
+            break
+        frames.append(frame)
+    source.release()
+    if not frames:
+        raise ValueError('No frames could be read from {}'.format(path))
+    return frames
+
+
+class ReplaySource:
+    """Plays back recorded frames through the part of the cv2.VideoCapture API VideoStream uses
+
+    Subclasses implement _next(out), returning the next frame or None at the
+    end (reading into out when that avoids a copy), and _rewind().
+    """
+
+    def __init__(self, rate='native', loop=False, fps=30):
+        self.rate = rate
+        self.loop = loop
+        self.fps = fps
+        # Without pacing, VideoStream waits for every frame to be consumed before reading the next
+        self.lockstep = rate == 'fast'
+        self.finished = False
+        self.played = 0
+        self.width = None
+        self.height = None
+        self.start_time = None
+
+    def isOpened(self):
+        return not self.finished
+
+    def set(self, prop, value):
+        # Frames are resized to the requested resolution, like a camera would deliver them
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+            return True
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+            return True
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def grab(self):
+        return self.read()[0]
+
+    def read(self, image=None):
+        """Return (grabbed, frame) like cv2.VideoCapture.read(), filling image if it fits"""
+        if self.finished:
+            return False, None
+        self._pace()
+
+        target = self._target_shape()
+        frame = self._next(image if image is not None and image.shape == target else None)
+        if frame is None and self.loop and self.played:
+            self._rewind()
+            frame = self._next(image if image is not None and image.shape == target else None)
+        if frame is None:
+            self.finished = True
+            return False, None
+
+        self.played += 1
+        return True, self._fit(frame, image)
+
+    def release(self):
+        self.finished = True
+
+    def _pace(self):
+        # At native rate, frame i is not delivered before start + i / fps
+        if self.rate != 'native' or not self.fps:
+            return
+        now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        delay = self.start_time + self.played / self.fps - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _target_shape(self):
+        if self.width and self.height:
+            return (self.height, self.width, 3)
+        return None
+
+    def _fit(self, frame, image):
+        # Scale to the requested resolution and land in image when it is given
+        if frame is image:
+            return image
+        target = self._target_shape()
+        if target is not None and frame.shape != target:
+            if image is not None and image.shape == target:
+                return cv2.resize(frame, (self.width, self.height), dst=image)
+            return cv2.resize(frame, (self.width, self.height))
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return image
+        return np.array(frame)
+
+    def _next(self, out):
+        raise NotImplementedError
+
+    def _rewind(self):
+        raise NotImplementedError
+
+
+class VideoFileSource(ReplaySource):
+    """Frames of a video file decoded with OpenCV"""
+
+    def __init__(self, path, rate='native', loop=False, fps=30):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError('Could not open video {}'.format(path))
+        # Prefer the rate recorded in the file
+        super().__init__(rate, loop, self.capture.get(cv2.CAP_PROP_FPS) or fps)
+
+    def _next(self, out):
+        if out is not None:
+            grabbed, frame = self.capture.read(image=out)
+        else:
+            grabbed, frame = self.capture.read()
+        return frame if grabbed else None
+
+    def _rewind(self):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        super().release()
+        self.capture.release()
+
+
+class ImageDirectorySource(ReplaySource):
+    """Image files of a directory in file name order"""
+
+    def __init__(self, path, rate='native', loop=False, fps=30):
+        super().__init__(rate, loop, fps)
+        self.paths = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if name.lower().endswith(IMAGE_EXTENSIONS)]
+        if not self.paths:
+            raise IOError('No images found in {}'.format(path))
+        self.index = 0
+
+    def _next(self, out):
+        while self.index < len(self.paths):
+            frame = cv2.imread(self.paths[self.index], cv2.IMREAD_COLOR)
+            if frame is not None:
+                self.index += 1
+                return frame
+            # Left out of later loops as well, so it is only reported once
+            print('Warning: could not read {}, skipping it'.format(self.paths.pop(self.index)))
+        return None
+
+    def _rewind(self):
+        self.index = 0
+
+
+class NumpySource(ReplaySource):
+    """Frames of a [N, H, W, 3] uint8 array saved with np.save, memory-mapped"""
+
+    def __init__(self, path, rate='native', loop=False, fps=30):
+        super().__init__(rate, loop, fps)
+        self.frames = np.load(path, mmap_mode='r')
+        if self.frames.ndim != 4 or self.frames.shape[3] != 3:
+            raise ValueError('{} holds an array of shape {}, expected [N, H, W, 3]'.format(path, self.frames.shape))
+        self.index = 0
+
+    def _next(self, out):
+        if self.index >= len(self.frames):
+            return None
+        frame = self.frames[self.index]
+        self.index += 1
+        if out is not None and out.shape == frame.shape:
+            np.copyto(out, frame)
+            return out
+        return frame
+
+    def _rewind(self):
+        self.index = 0
@@ -0,0 +1,44 @@
+# Result reuse.
+#
+# Detector wrappers such as the motion gate and distance pacing decide frame
+# by frame whether the wrapped detector has to run, or whether its previous
+# result still describes the scene well enough. ReusingDetector holds that
+# previous result and the bookkeeping around it; subclasses only decide.
+
+
+class ReusingDetector:
+    """Answers some frames with the wrapped detector's previous result
+
+    Wraps anything with detect(frame) returning DETECTION_DTYPE rows, and is
+    used the same way. Subclasses implement should_reuse(frame) and may
+    override on_inference(frame).
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.detections = None
+        # Consecutive frames answered with the current result
+        self.stale = 0
+
+        # Frames that ran the wrapped detector and frames that reused its result
+        self.inferred = 0
+        self.skipped = 0
+
+    def should_reuse(self, frame):
+        """Whether the previous result can stand in for frame, called on every frame"""
+        raise NotImplementedError
+
+    def on_inference(self, frame):
+        """Called after the wrapped detector ran on frame"""
+
+    def detect(self, frame):
+        if self.should_reuse(frame) and self.detections is not None:
+            self.stale += 1
+            self.skipped += 1
+            return self.detections
+
+        self.detections = self.detector.detect(frame)
+        self.stale = 0
+        self.inferred += 1
+        self.on_inference(frame)
+        return self.detections
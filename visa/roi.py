@@ -0,0 +1,103 @@
+# ROI-cropped inference.
+#
+# Once the hand and the target are found, the guidance logic only needs the
+# region around them, yet every frame is squeezed from 1280x720 into the
+# model's small input. RoiDetector crops the frame to the union of the last
+# relevant boxes plus a margin, runs the model on that crop and maps the boxes
+# back to full-frame coordinates, so small objects get more input pixels.
+#
+# The crop is grown to the aspect ratio of the frame, so objects are scaled
+# the same way as in a full-frame pass. The full frame is used again every
+# full_frame_interval frames, and whenever a class seen before goes missing
+# from the crop.
+
+import numpy as np
+
+from .labels import resolve_class_ids
+
+
+class RoiDetector:
+    """Runs the wrapped detector on a crop around recent detections"""
+
+    def __init__(self, detector, class_ids=None, score_threshold=0.5, margin=0.25,
+                 full_frame_interval=10, min_size=0.25):
+        """
+        class_ids -- class ids whose boxes define the crop, or a visa.labels.LabelRoles
+                     to use its current hand and target ids, all classes if None
+        score_threshold -- detections must score above this to define the crop
+        margin -- added on every side, as a fraction of the union's width and height
+        full_frame_interval -- run on the full frame at least every this many frames
+        min_size -- smallest crop, as a fraction of the frame's width and height
+        """
+        self.detector = detector
+        self.class_ids = class_ids
+        self.score_threshold = score_threshold
+        self.margin = margin
+        self.full_frame_interval = max(1, int(full_frame_interval))
+        self.min_size = min_size
+
+        # Normalized [ymin, xmin, ymax, xmax] of the next crop, None for the full frame
+        self.roi = None
+        self.roi_classes = set()
+        self.since_full_frame = 0
+
+        # Frames run on the full frame and on a crop
+        self.full_frames = 0
+        self.cropped = 0
+
+    def detect(self, frame):
+        if self.roi is None or self.since_full_frame >= self.full_frame_interval:
+            detections = self.detector.detect(frame)
+            self.full_frames += 1
+            self.since_full_frame = 1
+            self._update(detections, require=set())
+            return detections
+
+        height, width = frame.shape[:2]
+        ymin, xmin, ymax, xmax = self.roi
+        y0, y1 = int(ymin * height), int(np.ceil(ymax * height))
+        x0, x1 = int(xmin * width), int(np.ceil(xmax * width))
+
+        # A view into the frame, resized straight into the model input
+        detections = self.detector.detect(frame[y0:y1, x0:x1])
+
+        # Map crop-normalized boxes back onto the full frame
+        scale = np.array([(y1 - y0) / height, (x1 - x0) / width] * 2, dtype=np.float32)
+        offset = np.array([y0 / height, x0 / width] * 2, dtype=np.float32)
+        detections['box'] = detections['box'] * scale + offset
+
+        self.cropped += 1
+        self.since_full_frame += 1
+        self._update(detections, require=self.roi_classes)
+        return detections
+
+    def _update(self, detections, require):
+        # Crop the next frame around what was found, or fall back to the full frame
+        keep = detections['score'] > self.score_threshold
+        if self.class_ids is not None:
+            keep &= np.isin(detections['class_id'], resolve_class_ids(self.class_ids))
+        kept = detections[keep]
+        classes = set(kept['class_id'].tolist())
+        if not len(kept) or not require <= classes:
+            self.roi = None
+            self.roi_classes = set()
+            return
+
+        boxes = kept['box']
+        ymin, xmin = boxes[:, 0].min(), boxes[:, 1].min()
+        ymax, xmax = boxes[:, 2].max(), boxes[:, 3].max()
+        cy, cx = (ymin + ymax) / 2, (xmin + xmax) / 2
+
+        # In normalized coordinates equal extents keep the frame's aspect ratio
+        extent = max(ymax - ymin, xmax - xmin) * (1 + 2 * self.margin)
+        extent = min(1.0, max(extent, self.min_size))
+        half = extent / 2
+        cy = min(max(cy, half), 1 - half)
+        cx = min(max(cx, half), 1 - half)
+
+        if extent >= 1.0:
+            # Nothing to gain from cropping
+            self.roi = None
+        else:
+            self.roi = (cy - half, cx - half, cy + half, cx + half)
+        self.roi_classes = classes
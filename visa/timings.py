@@ -0,0 +1,122 @@
+# Per-stage latency tracking.
+#
+# The FPS overlay lumps every stage of a frame together. StageTimings keeps a
+# rolling window of the most recent durations of each stage (capture wait,
+# preprocess, invoke, decode, track, postprocess, draw, imshow, guidance) in a
+# preallocated ring buffer, and summarizes them as p50/p95/p99/max on demand.
+#
+# Recording is a store into a NumPy array, cheap enough for the hot path.
+# Every stage is recorded from a single thread, so no lock is taken; a
+# snapshot taken concurrently may miss the sample being written.
+#
+# Every stage also keeps cumulative counts over fixed LATENCY_BUCKETS since
+# start, which visa.metrics exports as Prometheus histograms.
+
+import bisect
+import json
+import time
+
+import numpy as np
+
+# Upper bounds in seconds of the cumulative latency buckets, +Inf is implied
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+STAGES = ('capture_wait', 'preprocess', 'invoke', 'decode', 'track', 'postprocess', 'draw', 'imshow', 'guidance', 'haptic', 'frame')
+
+
+def latency_summary(samples):
+    """p50/p95/p99/max/mean of a list of durations in seconds, reported in milliseconds"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    if not len(ms):
+        return {}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(ms.max()), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+    }
+
+
+class StageTimings:
+    """Rolling latency windows for the stages of the detection loop"""
+
+    def __init__(self, window=512, log_interval=10.0, snapshot_path=None):
+        """
+        window -- number of most recent samples kept per stage
+        log_interval -- seconds between log lines printed by report(), 0 disables them
+        snapshot_path -- JSON file rewritten with snapshot() on every report, if given
+        """
+        self.window = window
+        self.log_interval = log_interval
+        self.snapshot_path = snapshot_path
+        self.samples = {}
+        self.counts = {}
+        self.buckets = {}
+        self.totals = {}
+        for stage in STAGES:
+            self._add_stage(stage)
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def _add_stage(self, stage):
+        self.samples[stage] = np.zeros(self.window, dtype=np.float64)
+        self.counts[stage] = 0
+        self.buckets[stage] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.totals[stage] = 0.0
+
+    def record(self, stage, seconds):
+        """Add one duration in seconds to a stage"""
+        if stage not in self.samples:
+            self._add_stage(stage)
+        count = self.counts[stage]
+        self.samples[stage][count % self.window] = seconds
+        self.counts[stage] = count + 1
+        self.buckets[stage][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.totals[stage] += seconds
+
+    def since(self, stage, start):
+        """Record the time elapsed since a time.perf_counter() value, and return the current one"""
+        now = time.perf_counter()
+        self.record(stage, now - start)
+        return now
+
+    def snapshot(self):
+        """Summaries of every stage with samples, as a JSON-serializable dict"""
+        stages = {}
+        for stage, samples in self.samples.items():
+            count = self.counts[stage]
+            if not count:
+                continue
+            summary = latency_summary(samples[:min(count, self.window)])
+            summary['count'] = count
+            stages[stage] = summary
+        return {
+            'time': time.time(),
+            'uptime_s': round(time.monotonic() - self.started, 1),
+            'window': self.window,
+            'stages': stages,
+        }
+
+    def format(self, snapshot=None):
+        """One log line with p50/p95/p99/max in ms of every stage"""
+        snapshot = snapshot or self.snapshot()
+        parts = ['{} {:.1f}/{:.1f}/{:.1f}/{:.1f}'.format(
+            stage, summary['p50_ms'], summary['p95_ms'], summary['p99_ms'], summary['max_ms'])
+            for stage, summary in snapshot['stages'].items()]
+        return 'Latency p50/p95/p99/max ms: ' + ' | '.join(parts)
+
+    def report(self, force=False):
+        """Print the log line and write the snapshot once every log_interval seconds"""
+        now = time.monotonic()
+        if not force and (not self.log_interval or now - self.last_report < self.log_interval):
+            return
+        self.last_report = now
+        snapshot = self.snapshot()
+        if not snapshot['stages']:
+            return
+        print(self.format(snapshot))
+        if self.snapshot_path:
+            with open(self.snapshot_path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
@@ -0,0 +1,166 @@
+# Detect-then-track.
+#
+# The hand and the target barely move between consecutive frames, so running
+# the model on every frame mostly recomputes the same boxes. TrackingDetector
+# runs the wrapped detector every N frames and, in between, moves the last
+# boxes along with the image using sparse Lucas-Kanade optical flow on a small
+# grayscale copy of the frame. A grid of points inside every box is tracked
+# forward and back; the median displacement and spread of the points that
+# survive the round trip shift and scale the box. When too few points survive
+# for any box, the model runs again on that frame instead.
+#
+# Tracked detections keep the layout and scores of the detection they came
+# from, so postprocess() and the guidance logic work on them unchanged.
+
+import time
+
+import cv2
+import numpy as np
+
+from .labels import resolve_class_ids
+
+
+class BoxTracker:
+    """Moves normalized detection boxes from one frame to the next with optical flow"""
+
+    def __init__(self, width=320, grid=5, max_error=1.0):
+        """
+        width -- width in pixels of the grayscale image the flow is computed on
+        grid -- points tracked per box are a grid x grid lattice
+        max_error -- largest forward-backward error in pixels for a point to count as tracked
+        """
+        self.width = width
+        self.grid = grid
+        self.max_error = max_error
+        self.lk_params = dict(winSize=(15, 15), maxLevel=2,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.detections = None
+        self.gray = None
+
+    def _gray(self, frame):
+        # Downscale first, converting the small image is cheaper
+        height = max(1, int(round(frame.shape[0] * self.width / frame.shape[1])))
+        return cv2.cvtColor(cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY)
+
+    def _seed(self, boxes, size):
+        # Grid of points inset 10% from the edge of every box, in pixels of the gray image
+        height, width = size
+        steps = np.linspace(0.1, 0.9, self.grid, dtype=np.float32)
+        u, v = np.meshgrid(steps, steps)
+        u, v = u.ravel(), v.ravel()
+        ymin, xmin, ymax, xmax = boxes[:, 0:1], boxes[:, 1:2], boxes[:, 2:3], boxes[:, 3:4]
+        xs = (xmin + (xmax - xmin) * u) * width
+        ys = (ymin + (ymax - ymin) * v) * height
+        return np.stack([xs, ys], axis=-1).reshape(-1, 1, 2).astype(np.float32)
+
+    def start(self, frame, detections):
+        """Track detections (DETECTION_DTYPE rows found on frame) from now on"""
+        self.detections = detections.copy()
+        self.gray = self._gray(frame)
+
+    def update(self, frame):
+        """Move the tracked boxes onto frame
+
+        Returns (detections, confidence) where confidence is the smallest
+        fraction of points that were tracked reliably in any box, 1.0 if no
+        boxes are tracked.
+        """
+        gray = self._gray(frame)
+        detections = self.detections
+        if not len(detections):
+            self.gray = gray
+            return detections.copy(), 1.0
+
+        boxes = detections['box']
+        p0 = self._seed(boxes, gray.shape)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(self.gray, gray, p0, None, **self.lk_params)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.gray, p1, None, **self.lk_params)
+        self.gray = gray
+
+        # A point is trusted only if it tracks forward and back to where it started
+        error = np.linalg.norm((p0 - back).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < self.max_error)
+
+        per_box = self.grid * self.grid
+        good = good.reshape(len(boxes), per_box)
+        p0 = p0.reshape(len(boxes), per_box, 2)
+        p1 = p1.reshape(len(boxes), per_box, 2)
+        height, width = gray.shape
+
+        moved = detections.copy()
+        for i in range(len(boxes)):
+            mask = good[i]
+            if mask.sum() < 2:
+                continue
+            a, b = p0[i][mask], p1[i][mask]
+            dx, dy = np.median(b - a, axis=0)
+
+            # Scale from how far the points spread around their median, before and after
+            spread0 = np.median(np.linalg.norm(a - np.median(a, axis=0), axis=1))
+            spread1 = np.median(np.linalg.norm(b - np.median(b, axis=0), axis=1))
+            scale = np.clip(spread1 / spread0, 0.8, 1.25) if spread0 > 1e-3 else 1.0
+
+            ymin, xmin, ymax, xmax = boxes[i]
+            cx = (xmin + xmax) / 2 + dx / width
+            cy = (ymin + ymax) / 2 + dy / height
+            half_w = (xmax - xmin) * scale / 2
+            half_h = (ymax - ymin) * scale / 2
+            moved['box'][i] = np.clip([cy - half_h, cx - half_w, cy + half_h, cx + half_w], 0.0, 1.0)
+
+        self.detections = moved
+        confidence = float(good.mean(axis=1).min())
+        return moved.copy(), confidence
+
+
+class TrackingDetector:
+    """Runs a detector every interval frames and tracks its boxes in between"""
+
+    def __init__(self, detector, interval=5, min_confidence=0.5, score_threshold=0.5,
+                 class_ids=None, timings=None, tracker=None):
+        """
+        interval -- run the model on every interval-th frame
+        min_confidence -- run the model early when fewer than this fraction of a box's points track
+        score_threshold -- only detections scoring above this are tracked
+        class_ids -- optional class ids to track, or a visa.labels.LabelRoles to
+                     track its current hand and target ids, all classes if None
+        timings -- optional visa.timings.StageTimings to record the 'track' stage in
+        """
+        self.detector = detector
+        self.interval = max(1, int(interval))
+        self.min_confidence = min_confidence
+        self.score_threshold = score_threshold
+        self.class_ids = class_ids
+        self.timings = timings
+        self.tracker = tracker or BoxTracker()
+        self.since_detection = 0
+
+        # Frames that ran the model and frames that were tracked instead
+        self.detected = 0
+        self.tracked = 0
+
+    def detect(self, frame):
+        if self.tracker.detections is None or self.since_detection >= self.interval:
+            return self._detect(frame)
+
+        start = time.perf_counter()
+        detections, confidence = self.tracker.update(frame)
+        if self.timings is not None:
+            self.timings.since('track', start)
+        if confidence < self.min_confidence:
+            # Lost track of something, look again
+            return self._detect(frame)
+
+        self.since_detection += 1
+        self.tracked += 1
+        return detections
+
+    def _detect(self, frame):
+        detections = self.detector.detect(frame)
+        keep = detections['score'] > self.score_threshold
+        if self.class_ids is not None:
+            keep &= np.isin(detections['class_id'], resolve_class_ids(self.class_ids))
+        self.tracker.start(frame, detections[keep])
+        self.since_detection = 1
+        self.detected += 1
+        return detections
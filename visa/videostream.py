@@ -0,0 +1,183 @@
+# Define VideoStream class to handle streaming of video from webcam in separate processing thread
+# Source - Adrian Rosebrock, PyImageSearch: https://www.pyimagesearch.com/2015/12/28/increasing-raspberry-pi-fps-with-python-and-opencv/
+#
+# Every captured frame is stamped with a monotonically increasing sequence
+# number and a capture timestamp. Consumers can block on wait_for_frame() until
+# a frame newer than the last one they processed arrives, instead of polling
+# read() and running inference on the same frame twice.
+#
+# With a pool_size the capture thread reads into a fixed ring of preallocated
+# buffers. Frames returned by read_latest() and wait_for_frame() are then
+# borrowed and must be handed back with release() once the consumer is done.
+#
+# Given a source from visa.replay instead of the camera, the stream replays
+# recorded frames. A source replaying as fast as possible is read in lockstep
+# with the consumer, and the stream stops by itself when a source runs out.
+
+import time
+from threading import Condition, Thread
+
+import cv2
+
+from .framepool import FramePool
+
+
+class VideoStream:
+    """Camera object that controls video streaming from the Picamera"""
+    def __init__(self,resolution=(640,480),framerate=30,pool_size=None,source=None):
+        # Initialize the PiCamera and the camera image stream, or replay a recording
+        self.stream = cv2.VideoCapture(0) if source is None else source
+        self.lockstep = getattr(self.stream, 'lockstep', False)
+        ret = self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        ret = self.stream.set(3,resolution[0])
+        ret = self.stream.set(4,resolution[1])
+
+        # Guards frame, seq and timestamp and wakes consumers on every new frame
+        self.condition = Condition()
+
+        # Read first frame from the stream
+        (self.grabbed, self.frame) = self.stream.read()
+        self.seq = 1 if self.grabbed else 0
+        self.timestamp = time.monotonic()
+
+        # Move the first frame into the pool; the stream holds a reference to its latest frame
+        self.pool = None
+        if pool_size and self.grabbed:
+            self.pool = FramePool(pool_size, self.frame.shape, self.frame.dtype)
+            buf = self.pool.acquire()
+            buf[...] = self.frame
+            self.frame = buf
+
+        # Frames the consumer never saw, and frames it was handed more than once
+        self.last_read_seq = 0
+        self.dropped = 0
+        self.duplicated = 0
+
+        # Variable to control when the camera is stopped
+        self.stopped = False
+
+    def start(self):
+        # Start the thread that reads frames from the video stream
+        Thread(target=self.update,args=()).start()
+        return self
+
+    def update(self):
+        # Keep looping indefinitely until the thread is stopped
+        while True:
+            # If the camera is stopped, stop the thread
+            if self.stopped:
+                # Close camera resources
+                self.stream.release()
+                return
+
+            # A fast replay waits until the consumer has taken the latest frame
+            if self.lockstep:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.last_read_seq >= self.seq or self.stopped)
+                    if self.stopped:
+                        continue
+
+            # Otherwise, grab the next frame from the stream.
+            # read() blocks until the camera delivers a frame, so this does not spin.
+            if self.pool is None:
+                (grabbed, frame) = self.stream.read()
+            else:
+                buf = self.pool.acquire()
+                if buf is None:
+                    if self.lockstep:
+                        # A replay can wait for a buffer instead of skipping a frame
+                        time.sleep(0.001)
+                        continue
+                    # Every buffer is still borrowed, drain the camera and drop this frame
+                    self.stream.grab()
+                    continue
+                (grabbed, frame) = self.stream.read(image=buf)
+                if not grabbed or frame is not buf:
+                    # Nothing was read, or OpenCV had to allocate a frame of a different size
+                    self.pool.release(buf)
+
+            if not grabbed:
+                if getattr(self.stream, 'finished', False):
+                    # End of a replayed recording, wake consumers and stop
+                    self.stop()
+                    continue
+                # Camera hiccup, back off instead of spinning on a failing device
+                self.grabbed = False
+                time.sleep(0.01)
+                continue
+
+            with self.condition:
+                previous = self.frame
+                self.grabbed = True
+                self.frame = frame
+                self.seq += 1
+                self.timestamp = time.monotonic()
+                self.condition.notify_all()
+
+            # The stream no longer holds the frame it just replaced
+            self.release(previous)
+
+    def read(self):
+        # Return the most recent frame. It is not borrowed, so with a pool it may be
+        # refilled once newer frames arrive; use read_latest() to hold on to it.
+        with self.condition:
+            self._account(self.seq)
+            return self.frame
+
+    def read_latest(self):
+        """Return the most recent (frame, seq, timestamp) without waiting, borrowing the frame"""
+        with self.condition:
+            self._account(self.seq)
+            self._borrow(self.frame)
+            return self.frame, self.seq, self.timestamp
+
+    def wait_for_frame(self, last_seq, timeout=None):
+        """Block until a frame newer than last_seq is captured
+
+        Returns (frame, seq, timestamp), or None if the timeout expired or the
+        stream was stopped first. The frame is borrowed until release() is called.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > last_seq or self.stopped, timeout):
+                return None
+            if self.seq <= last_seq:
+                return None
+            self._account(self.seq)
+            self._borrow(self.frame)
+            return self.frame, self.seq, self.timestamp
+
+    def release(self, frame):
+        """Hand a borrowed frame back to the pool; a no-op without a pool"""
+        if self.pool is not None:
+            self.pool.release(frame)
+
+    def stats(self):
+        """Return capture counters as a dict"""
+        with self.condition:
+            return {
+                'captured': self.seq,
+                'dropped': self.dropped,
+                'duplicated': self.duplicated,
+                'pool_misses': self.pool.misses if self.pool is not None else 0,
+            }
+
+    def _borrow(self, frame):
+        if self.pool is not None:
+            self.pool.retain(frame)
+
+    def _account(self, seq):
+        # Caller holds the condition
+        if seq == self.last_read_seq:
+            self.duplicated += 1
+        elif seq > self.last_read_seq + 1:
+            self.dropped += seq - self.last_read_seq - 1
+        self.last_read_seq = seq
+        if self.lockstep:
+            # Let the capture thread read the next frame
+            self.condition.notify_all()
+
+    def stop(self):
+        # Indicate that the camera and thread should be stopped, and wake any waiting consumer
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
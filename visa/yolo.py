@@ -0,0 +1,100 @@
+# YOLOv5 output decoding.
+#
+# The SSD MobileNet models end in a postprocess op that already returns boxes,
+# classes and scores as separate tensors. The YOLOv5 exports in
+# yolov5-openvino-tflite-onnx/ instead return the raw prediction tensor
+# [1, N, 5 + classes] with one row of (x, y, w, h, objectness, class scores...)
+# per anchor, so thresholding, class selection and NMS are done here in NumPy.
+# The result uses the same DETECTION_DTYPE layout as the SSD path.
+
+import numpy as np
+
+from .postprocess import DETECTION_DTYPE
+
+# Cap on candidates entering NMS, as in the reference YOLOv5 implementation
+MAX_NMS_CANDIDATES = 3000
+
+
+def is_yolov5_output(output_details):
+    """True if the model has a single [1, N, 5 + classes] prediction output"""
+    if len(output_details) != 1:
+        return False
+    shape = output_details[0]['shape']
+    return len(shape) == 3 and shape[2] > 5
+
+
+def dequantize(values, quantization):
+    """Convert int8/uint8 tensor values to float32 using (scale, zero_point)"""
+    scale, zero_point = quantization
+    if values.dtype == np.float32 or not scale:
+        return values.astype(np.float32, copy=False)
+    return (values.astype(np.float32) - zero_point) * scale
+
+
+def nms(boxes, scores, iou_threshold, max_detections):
+    """Greedy non-maximum suppression, returns indices of the kept boxes
+
+    boxes -- [N, 4] array of (x1, y1, x2, y2)
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores)
+
+    keep = []
+    while order.size and len(keep) < max_detections:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        # IoU of the best remaining box against all others at once
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def decode_yolov5(pred, input_width, input_height, score_threshold=0.25, iou_threshold=0.45, max_detections=100):
+    """Decode a [N, 5 + classes] YOLOv5 prediction into a DETECTION_DTYPE array
+
+    Boxes come out normalized as [ymin, xmin, ymax, xmax], like the SSD models.
+    Exports that emit pixel coordinates of the model input are detected and
+    scaled by input_width/input_height.
+    """
+    # Objectness alone bounds the final score, so drop most anchors cheaply first
+    objectness = pred[:, 4]
+    candidates = pred[objectness > score_threshold]
+
+    class_scores = candidates[:, 5:] * candidates[:, 4:5]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_ids)), class_ids]
+
+    confident = scores > score_threshold
+    candidates = candidates[confident]
+    class_ids = class_ids[confident]
+    scores = scores[confident]
+
+    if len(scores) > MAX_NMS_CANDIDATES:
+        top = np.argpartition(-scores, MAX_NMS_CANDIDATES)[:MAX_NMS_CANDIDATES]
+        candidates, class_ids, scores = candidates[top], class_ids[top], scores[top]
+
+    xywh = candidates[:, :4].astype(np.float32)
+    if len(xywh) and xywh.max() > 2.0:
+        xywh = xywh / np.array([input_width, input_height, input_width, input_height], dtype=np.float32)
+
+    boxes = np.empty_like(xywh)
+    boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2 # x1
+    boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2 # y1
+    boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2 # x2
+    boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2 # y2
+
+    # Offset boxes per class so one NMS pass never suppresses across classes
+    offsets = class_ids[:, None].astype(np.float32) * 2.0
+    keep = nms(boxes + offsets, scores, iou_threshold, max_detections)
+
+    detections = np.empty(len(keep), dtype=DETECTION_DTYPE)
+    detections['box'] = boxes[keep][:, [1, 0, 3, 2]]
+    detections['class_id'] = class_ids[keep]
+    detections['score'] = scores[keep]
+    return detections